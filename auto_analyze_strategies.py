@@ -14,6 +14,21 @@ from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 
+try:
+    import python_calamine  # noqa: F401
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
+def _read_excel(path):
+    """讀取Excel：優先使用 calamine 引擎，失敗時退回 openpyxl"""
+    if CALAMINE_AVAILABLE:
+        try:
+            return pd.read_excel(path, engine='calamine')
+        except Exception:
+            pass
+    return pd.read_excel(path, engine='openpyxl')
+
 # ==========================================
 # 設定區
 # ==========================================
@@ -54,21 +69,49 @@ HALF_YEAR_DAYS = 183
 # 核心演算法
 # ==========================================
 
-def _get_week_unions(df, window_days, is_fantasy):
-    """回傳 (week_unions, total_weeks)。week_unions[(year,week)] = 該週時間段內開出號碼的 set。"""
+def _prepare_window_data(df, window_days, is_fantasy=False):
+    """
+    篩出指定時間段的資料，並附上 Numbers（號碼 set）與 YearWeek（ISO 年, 週）欄位。
+    號碼欄一次整欄轉數值，無法轉換的列直接剔除（同 extract_numbers 回傳 None 的情況）。
+    """
     window_data = df[df['Analysis_Date'].dt.weekday.isin(window_days)].copy()
+    if len(window_data) == 0:
+        return window_data
+    
+    if '號碼1' in window_data.columns:
+        number_cols = ['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']
+    else:
+        # 嘗試其他可能的欄位名稱
+        number_cols = window_data.columns[2:7].tolist()
+    numbers = window_data[number_cols].apply(pd.to_numeric, errors='coerce')
+    valid = numbers.notna().all(axis=1).to_numpy()
+    window_data = window_data[valid].copy()
+    
+    rows = numbers[valid].to_numpy(dtype=np.int64).tolist()
+    window_data['Numbers'] = [set(row) for row in rows]
+    iso = window_data['Analysis_Date'].dt.isocalendar()
+    window_data['YearWeek'] = list(zip(iso['year'].tolist(), iso['week'].tolist()))
+    return window_data
+
+def _numbers_to_mask(nums):
+    """號碼集合轉為位元遮罩（第 n 位代表號碼 n），交集判斷只需一次整數 AND。"""
+    mask = 0
+    for n in nums:
+        mask |= (1 << int(n))
+    return mask
+
+def _get_week_unions(df, window_days, is_fantasy):
+    """回傳 (week_unions, total_weeks)。week_unions[(year,week)] = 該週時間段內開出號碼的位元遮罩。"""
+    window_data = _prepare_window_data(df, window_days, is_fantasy)
     if len(window_data) == 0:
         return {}, 0
-    window_data['Numbers'] = window_data.apply(lambda row: extract_numbers(row, is_fantasy), axis=1)
-    window_data = window_data[window_data['Numbers'].notna()].copy()
-    window_data['YearWeek'] = window_data['Analysis_Date'].apply(lambda x: (x.isocalendar()[0], x.isocalendar()[1]))
     week_unions = {}
     for (year, week), group in window_data.groupby('YearWeek'):
-        union_set = set()
+        union_mask = 0
         for nums in group['Numbers']:
             if nums:
-                union_set.update(nums)
-        week_unions[(year, week)] = union_set
+                union_mask |= _numbers_to_mask(nums)
+        week_unions[(year, week)] = union_mask
     return week_unions, len(week_unions)
 
 def load_data(file_path, is_fantasy=False, recent_days=None):
@@ -76,7 +119,7 @@ def load_data(file_path, is_fantasy=False, recent_days=None):
     df = None
     if os.path.exists(file_path):
         try:
-            df = pd.read_excel(file_path, engine='openpyxl')
+            df = _read_excel(file_path)
         except Exception as e:
             print(f"   ⚠️ 讀取 Excel 失敗: {e}，嘗試 CSV...")
     if df is None:
@@ -147,23 +190,13 @@ def calculate_window_win_rate(df, window_name, window_days, is_fantasy=False):
     
     返回: [{'combo': tuple, 'win_rate': float, 'wins': int, 'total': int, 'missed_dates': list}, ...]
     """
-    # 過濾出該時間段的資料
-    window_data = df[df['Analysis_Date'].dt.weekday.isin(window_days)].copy()
+    # 過濾出該時間段的資料，預先提取所有號碼集合與所屬週次，避免重複計算
+    window_data = _prepare_window_data(df, window_days, is_fantasy)
     
     if len(window_data) == 0:
         return []
     
-    # 預先提取所有號碼集合，避免重複計算
-    window_data['Numbers'] = window_data.apply(
-        lambda row: extract_numbers(row, is_fantasy), axis=1
-    )
-    window_data = window_data[window_data['Numbers'].notna()].copy()
-    
     # 將資料按週分組，並預先計算每週的號碼聯集
-    window_data['YearWeek'] = window_data['Analysis_Date'].apply(
-        lambda x: (x.isocalendar()[0], x.isocalendar()[1])
-    )
-    
     # 預先計算每週的號碼聯集（該週時間段內所有開出的號碼）
     # 同時記錄每週的時間段第一天日期
     week_unions = {}
@@ -173,11 +206,11 @@ def calculate_window_win_rate(df, window_name, window_days, is_fantasy=False):
     first_weekday = min(window_days)
     
     for (year, week), group in window_data.groupby('YearWeek'):
-        union_set = set()
+        union_mask = 0
         for nums in group['Numbers']:
             if nums:
-                union_set.update(nums)
-        week_unions[(year, week)] = union_set
+                union_mask |= _numbers_to_mask(nums)
+        week_unions[(year, week)] = union_mask
         
         # 找到該週中時間段的第一天（weekday為first_weekday的那天）
         first_day_records = group[group['Analysis_Date'].dt.weekday == first_weekday]
@@ -198,44 +231,40 @@ def calculate_window_win_rate(df, window_name, window_days, is_fantasy=False):
     all_combos = list(combinations(range(1, max_num + 1), 3))
     total_combos = len(all_combos)
     
-    results = []
-    
     # 顯示進度
     print(f"         計算中... (共 {total_combos} 組組合, {total_weeks} 週)", end='', flush=True)
     
-    for idx, combo in enumerate(all_combos):
-        # 每1000個組合顯示一次進度
-        if idx % 1000 == 0 and idx > 0:
-            progress = (idx / total_combos) * 100
-            print(f"\r         進度: {progress:.1f}% ({idx}/{total_combos})", end='', flush=True)
-        
-        combo_set = set(combo)
-        wins = 0
+    # 一次以位元遮罩比對所有組合 x 所有週：hits[i, w] 表示組合 i 在第 w 週中獎
+    week_keys = list(week_unions.keys())
+    week_masks = np.array([week_unions[key] for key in week_keys], dtype=np.uint64)
+    combo_masks = np.bitwise_or.reduce(
+        np.left_shift(np.uint64(1), np.array(all_combos, dtype=np.uint64)), axis=1
+    )
+    hits = (combo_masks[:, None] & week_masks[None, :]) != 0
+    wins_per_combo = hits.sum(axis=1)
+    
+    # 按勝率排序（穩定排序，同勝率維持組合原本順序）
+    order = np.argsort(-wins_per_combo, kind='stable')
+    
+    # 只有排名前段的組合需要整理成結果（含未中獎日期）
+    results = []
+    for idx in order[:60]:
+        wins = int(wins_per_combo[idx])
         missed_dates = []  # 記錄未中獎的時間段第一天日期
+        for w in np.flatnonzero(~hits[idx]):
+            first_date = week_first_dates.get(week_keys[w])
+            if first_date:
+                missed_dates.append(first_date)
         
-        # 使用預先計算的週聯集，快速判斷
-        for (year, week), week_union in week_unions.items():
-            # 如果組合與該週的號碼聯集有交集，則中獎
-            if not combo_set.isdisjoint(week_union):
-                wins += 1
-            else:
-                # 未中獎，記錄該週的時間段第一天日期
-                first_date = week_first_dates.get((year, week))
-                if first_date:
-                    missed_dates.append(first_date)
-        
-        win_rate = wins / total_weeks
         results.append({
-            'combo': combo,
-            'win_rate': win_rate,
+            'combo': all_combos[idx],
+            'win_rate': wins / total_weeks,
             'wins': wins,
             'total': total_weeks,
             'missed_dates': sorted(missed_dates)  # 按日期排序
         })
     
-    # 按勝率排序
-    results.sort(key=lambda x: x['win_rate'], reverse=True)
-    print(f"\r         完成！找到 {len(results)} 組結果" + " " * 40)  # 清除進度顯示
+    print(f"\r         完成！找到 {total_combos} 組結果" + " " * 40)  # 清除進度顯示
     
     # 先取前60名進行去重處理（確保去重後有足夠的候選）
     top_results = results[:60]
@@ -322,7 +351,7 @@ def calculate_window_win_rate_one(df, window_name, window_days, is_fantasy=False
     max_num = 39
     results = []
     for num in range(1, max_num + 1):
-        wins = sum(1 for u in week_unions.values() if num in u)
+        wins = sum(1 for u in week_unions.values() if (u >> num) & 1)
         results.append({
             'combo': (num,),
             'win_rate': wins / total_weeks,
@@ -341,8 +370,8 @@ def calculate_window_win_rate_two(df, window_name, window_days, is_fantasy=False
     all_twos = list(combinations(range(1, max_num + 1), 2))
     results = []
     for combo in all_twos:
-        combo_set = set(combo)
-        wins = sum(1 for u in week_unions.values() if not combo_set.isdisjoint(u))
+        combo_mask = _numbers_to_mask(combo)
+        wins = sum(1 for u in week_unions.values() if combo_mask & u)
         results.append({
             'combo': combo,
             'win_rate': wins / total_weeks,
@@ -375,12 +404,9 @@ def build_three_month_entries(single_results, two_results, threshold=WIN_RATE_TH
 
 def _build_week_day_sets(df, window_days, is_fantasy=False):
     """回傳指定時段每週內各日號碼集合（list[list[set]]）。"""
-    window_data = df[df['Analysis_Date'].dt.weekday.isin(window_days)].copy()
+    window_data = _prepare_window_data(df, window_days, is_fantasy)
     if len(window_data) == 0:
         return []
-    window_data['Numbers'] = window_data.apply(lambda row: extract_numbers(row, is_fantasy), axis=1)
-    window_data = window_data[window_data['Numbers'].notna()].copy()
-    window_data['YearWeek'] = window_data['Analysis_Date'].apply(lambda x: (x.isocalendar()[0], x.isocalendar()[1]))
     week_blocks = []
     for _, group in window_data.groupby('YearWeek'):
         day_sets = [set(nums) for nums in group['Numbers'] if nums]
@@ -481,62 +507,88 @@ def _merge_top_items(items, top_n):
     for item in items:
         _push_top_n(heap, item, top_n)
     merged = [x[1] for x in heap]
-    merged.sort(key=lambda x: (x['win_rate'], x['avg_hit'], x['wins']), reverse=True)
+    merged.sort(key=lambda x: (x['win_rate'], x['avg_hit'], x['wins'], x['combo']), reverse=True)
     return merged
 
+# 0-65535 每個值的 1 位元數；號碼最大 39，遮罩拆成三段 16 位元查表相加即為 popcount
+_POPCOUNT16 = np.array([bin(i).count('1') for i in range(1 << 16)], dtype=np.uint8)
+
+def _popcount_masks(masks):
+    """uint64 位元遮罩陣列逐元素計算 1 位元數（即交集號碼數）。"""
+    return (_POPCOUNT16[masks & np.uint64(0xFFFF)]
+            + _POPCOUNT16[(masks >> np.uint64(16)) & np.uint64(0xFFFF)]
+            + _POPCOUNT16[masks >> np.uint64(32)])
+
+def _top_n_indices(wins, hit_sum, candidates, top_n):
+    """依 (wins, hit_sum, 組合順序) 由大到小取前 N 個候選索引（等同 _push_top_n 的排序鍵）。"""
+    if len(candidates) == 0:
+        return candidates
+    order = np.lexsort((candidates, hit_sum[candidates], wins[candidates]))
+    return candidates[order[::-1][:top_n]]
+
+def _combination_array(values, k):
+    """
+    以 NumPy 整批展開 values 取 k 個的所有組合，順序與 itertools.combinations 相同（字典序）。
+    每一輪把每列接上所有比最後一個索引大的索引，不逐一產生 tuple。
+    """
+    values = np.asarray(values)
+    n = len(values)
+    combos = np.arange(n).reshape(-1, 1)
+    for _ in range(k - 1):
+        last = combos[:, -1]
+        counts = n - 1 - last
+        starts = np.cumsum(counts) - counts
+        offsets = np.arange(counts.sum()) - np.repeat(starts, counts)
+        next_idx = np.repeat(last + 1, counts) + offsets
+        combos = np.column_stack([np.repeat(combos, counts, axis=0), next_idx])
+    return values[combos]
+
 def _scan_six_combo_worker(args):
     """
     掃描固定第一顆號碼的所有六碼組合。
+    所有組合打包成 uint64 位元遮罩，逐日以整批 AND + popcount 計算命中數。
     回傳：processed_count, guaranteed_items, fallback_items
     """
     first_num, week_day_masks, top_n = args
     total_weeks = len(week_day_masks)
-    guaranteed_heap = []
-    fallback_heap = []
-    processed = 0
-
-    for b in range(first_num + 1, 40):
-        for c in range(b + 1, 40):
-            for d in range(c + 1, 40):
-                for e in range(d + 1, 40):
-                    for f in range(e + 1, 40):
-                        combo = (first_num, b, c, d, e, f)
-                        combo_mask = 0
-                        for n in combo:
-                            combo_mask |= (1 << n)
-
-                        wins = 0
-                        hit_sum = 0
-                        min_hit = 99
-                        for day_masks in week_day_masks:
-                            best_hit = 0
-                            for dm in day_masks:
-                                h = (combo_mask & dm).bit_count()
-                                if h > best_hit:
-                                    best_hit = h
-                            hit_sum += best_hit
-                            if best_hit < min_hit:
-                                min_hit = best_hit
-                            if best_hit >= 2:
-                                wins += 1
-
-                        item = {
-                            'combo': combo,
-                            'win_rate': wins / total_weeks,
-                            'wins': wins,
-                            'total': total_weeks,
-                            'avg_hit': hit_sum / total_weeks,
-                            'min_hit': min_hit,
-                        }
-                        if wins == total_weeks:
-                            _push_top_n(guaranteed_heap, item, top_n)
-                        else:
-                            _push_top_n(fallback_heap, item, top_n)
-                        processed += 1
-
-    guaranteed = [x[1] for x in guaranteed_heap]
-    fallback = [x[1] for x in fallback_heap]
-    return processed, guaranteed, fallback
+
+    # 其餘五顆依字典序展開，組合索引即原本逐一列舉的順序
+    rest = _combination_array(np.arange(first_num + 1, 40, dtype=np.uint64), 5)
+    combo_count = len(rest)
+    combo_masks = np.full(combo_count, 1 << first_num, dtype=np.uint64)
+    for k in range(5):
+        combo_masks |= np.uint64(1) << rest[:, k]
+
+    wins = np.zeros(combo_count, dtype=np.int64)
+    hit_sum = np.zeros(combo_count, dtype=np.int64)
+    min_hit = np.full(combo_count, 99, dtype=np.int64)
+    for day_masks in week_day_masks:
+        best_hit = np.zeros(combo_count, dtype=np.uint8)
+        for dm in day_masks:
+            np.maximum(best_hit, _popcount_masks(combo_masks & np.uint64(dm)), out=best_hit)
+        hit_sum += best_hit
+        np.minimum(min_hit, best_hit, out=min_hit)
+        wins += best_hit >= 2
+
+    # 只為各類別前 N 名建立結果 dict
+    all_idx = np.arange(combo_count)
+    is_guaranteed = wins == total_weeks
+    guaranteed_idx = _top_n_indices(wins, hit_sum, all_idx[is_guaranteed], top_n)
+    fallback_idx = _top_n_indices(wins, hit_sum, all_idx[~is_guaranteed], top_n)
+
+    def make_item(i):
+        return {
+            'combo': (first_num,) + tuple(int(x) for x in rest[i]),
+            'win_rate': int(wins[i]) / total_weeks,
+            'wins': int(wins[i]),
+            'total': total_weeks,
+            'avg_hit': int(hit_sum[i]) / total_weeks,
+            'min_hit': int(min_hit[i]),
+        }
+
+    guaranteed = [make_item(i) for i in guaranteed_idx]
+    fallback = [make_item(i) for i in fallback_idx]
+    return combo_count, guaranteed, fallback
 
 def _full_scan_top_six_entries(week_blocks, top_n=TOP_N_6NUM):
     """
@@ -547,15 +599,7 @@ def _full_scan_top_six_entries(week_blocks, top_n=TOP_N_6NUM):
     if not week_blocks:
         return [], []
 
-    week_day_masks = []
-    for days in week_blocks:
-        masks = []
-        for day_set in days:
-            m = 0
-            for n in day_set:
-                m |= (1 << int(n))
-            masks.append(m)
-        week_day_masks.append(masks)
+    week_day_masks = [[_numbers_to_mask(day_set) for day_set in days] for days in week_blocks]
 
     first_nums = list(range(1, 35))  # 第一顆最大到34，確保後面還有5顆
     tasks = [(x, week_day_masks, top_n) for x in first_nums]
@@ -10,7 +10,13 @@ from pathlib import Path
 from datetime import datetime
 import os
 import logging
-from collections import defaultdict
+from openpyxl import Workbook, load_workbook
+
+try:
+    import python_calamine  # noqa: F401
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -37,13 +43,47 @@ EV_W_MOMENTUM = 1.0
 EV_MOMENTUM_K = 7
 EV_W_OVERDUE = 0.4
 
+def _create_rng():
+    """建立選號用的亂數產生器：LOTTERY_SEED 為非負整數時固定種子，格式錯誤則警告並改用隨機種子"""
+    seed = os.environ.get('LOTTERY_SEED')
+    if seed:
+        try:
+            return np.random.default_rng(int(seed))
+        except ValueError:
+            logger.warning(f"⚠️ LOTTERY_SEED 不是有效的非負整數 ({seed!r})，改用隨機種子")
+    return np.random.default_rng()
+
+# 選號共用的亂數產生器（設定 LOTTERY_SEED 環境變數可固定種子以重現選號結果）
+_RNG = _create_rng()
+
+# 預測只用到日期與五個號碼欄，讀檔時略過其餘欄位
+HISTORY_COLUMNS = ['日期', '號碼1', '號碼2', '號碼3', '號碼4', '號碼5']
+
 # 從原本的 lottery_analysis.py 複製核心函數
 def load_lottery_excel(excel_path: str):
-    """讀入 .xlsx 開獎紀錄"""
-    df = pd.read_excel(excel_path, engine='openpyxl')
+    """讀入 .xlsx 開獎紀錄（優先使用 calamine 引擎，失敗時退回 openpyxl）"""
+    usecols = lambda col: col in HISTORY_COLUMNS
+    df = None
+    if CALAMINE_AVAILABLE:
+        try:
+            df = pd.read_excel(excel_path, engine='calamine', usecols=usecols)
+        except Exception as e:
+            logger.warning(f"⚠️ calamine 讀取失敗，改用 openpyxl: {e}")
+    if df is None:
+        df = pd.read_excel(excel_path, engine='openpyxl', usecols=usecols)
     
-    # 確保日期欄位是 datetime 類型
-    if '日期' in df.columns:
+    # 號碼不完整的列在讀檔時一次剔除，後續計算不必再逐列檢查空值
+    number_cols = [col for col in HISTORY_COLUMNS[1:] if col in df.columns]
+    if number_cols:
+        incomplete = df[number_cols].isna().any(axis=1)
+        if incomplete.any():
+            logger.warning(f"⚠️ 略過 {int(incomplete.sum())} 筆號碼不完整的記錄")
+            df = df[~incomplete].reset_index(drop=True)
+        # 號碼範圍 1-39，以 int8 儲存
+        df[number_cols] = df[number_cols].astype(np.int8)
+    
+    # 確保日期欄位是 datetime 類型（Excel 日期儲存格已由引擎轉好則略過）
+    if '日期' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['日期']):
         # 嘗試多種日期格式解析
         try:
             df['日期'] = pd.to_datetime(df['日期'], format='mixed', errors='coerce')
@@ -60,15 +100,58 @@ def load_lottery_excel(excel_path: str):
             # 如果轉換失敗，嘗試不指定格式
             df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
     
+    # 依日期排序（舊的在前），後續可用二分搜尋切出近期資料
+    if '日期' in df.columns:
+        df = df.sort_values('日期', kind='stable').reset_index(drop=True)
+    
     return df
 
 
 
+def _days_before(end_date, dates):
+    """end_date 與各筆日期相差的天數：以 datetime64[D] 直接做整數相減，不經 Timedelta 轉換（NaT 為 NaN）"""
+    elapsed = np.datetime64(end_date, 'D') - dates.to_numpy().astype('datetime64[D]')
+    return np.where(np.isnat(elapsed), np.nan, elapsed.astype(float))
+
+
+def _decay_weights(days_ago, decay):
+    """decay ** days_ago 的查表版本：天數皆為整數，先建 decay ** k 表再以索引取值（NaN 天數維持 NaN）"""
+    valid = ~np.isnan(days_ago)
+    days = np.where(valid, days_ago, 0).astype(np.int64)
+    # 表格從最小天數起算，未來日期（負天數）照樣得到 decay ** days，是否截斷由呼叫端決定
+    lo = days.min(initial=0)
+    table = decay ** np.arange(lo, days.max(initial=0) + 1, dtype=float)
+    return np.where(valid, table[days - lo], np.nan)
+
+
 def compute_weighted_frequency(df, decay_factor=0.95, recent_days=365):
     """
     計算時間加權的號碼頻率
     越近期的記錄權重越高，避免資料鈍化問題
     """
+    freq = _compute_weighted_frequency(df, decay_factor, recent_days)
+    if freq is None:
+        return {}
+    # 只回傳出現過的號碼，未出現者由呼叫端以預設值處理
+    return {int(num): float(freq[num]) for num in np.flatnonzero(~np.isnan(freq))}
+
+
+def compute_weighted_frequency_array(df, decay_factor=0.95, recent_days=365, default=0.001):
+    """
+    與 compute_weighted_frequency 相同，但回傳長度 40 的陣列（索引即號碼）
+    未出現的號碼填入 default；計算失敗或沒有資料時回傳 None
+    """
+    freq = _compute_weighted_frequency(df, decay_factor, recent_days)
+    if freq is None:
+        return None
+    return np.where(np.isnan(freq), default, freq)
+
+
+def _compute_weighted_frequency(df, decay_factor, recent_days):
+    """
+    加權頻率的實際計算
+    回傳長度 40 的陣列，未出現的號碼為 NaN；失敗或沒有資料時回傳 None
+    """
     try:
         # 確保日期欄位是 datetime 類型
         if '日期' in df.columns:
@@ -85,45 +168,46 @@ def compute_weighted_frequency(df, decay_factor=0.95, recent_days=365):
         
         # 只取最近的記錄
         cutoff_date = datetime.now() - pd.Timedelta(days=recent_days)
-        recent_df = df[df['日期'] >= cutoff_date].copy()
+        if df['日期'].is_monotonic_increasing:
+            # 已依日期排序：二分搜尋找出起點，以切片取代布林遮罩
+            start = np.searchsorted(df['日期'].to_numpy(), np.datetime64(cutoff_date), side='left')
+            recent_df = df.iloc[start:]
+        else:
+            recent_df = df[df['日期'] >= cutoff_date]
         
         if len(recent_df) == 0:
             logger.warning("⚠️ 沒有足夠的近期記錄，使用全部資料")
-            recent_df = df.copy()
+            recent_df = df
         
         logger.info(f"⚖️ 使用最近 {len(recent_df)} 筆記錄進行加權分析")
         
-        # 計算每筆記錄距今的天數
-        today = datetime.now()
-        recent_df['days_ago'] = (today - recent_df['日期']).dt.days
-        
-        # 計算加權頻率
-        weighted_freq = defaultdict(float)
-        total_weight = 0
+        # 計算每筆記錄距今的天數與權重：越近期權重越高
+        days_ago = _days_before(datetime.now(), recent_df['日期'])
+        weights = _decay_weights(days_ago, decay_factor)
+        total_weight = weights.sum()
         
-        for _, row in recent_df.iterrows():
-            # 計算權重：越近期權重越高
-            weight = decay_factor ** row['days_ago']
-            total_weight += weight
-            
-            # 累加每個號碼的加權頻率
-            for col in ['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']:
-                if pd.notna(row[col]):
-                    number = int(row[col])
-                    weighted_freq[number] += weight
+        # 五個號碼欄堆成 (N, 5) 陣列，略過空值後一次以 bincount 累加加權頻率
+        numbers = recent_df[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=float)
+        mask = ~np.isnan(numbers)
+        flat_numbers = numbers[mask].astype(np.int64)
+        flat_weights = np.broadcast_to(weights[:, None], numbers.shape)[mask]
+        weighted_freq = np.bincount(flat_numbers, weights=flat_weights, minlength=40)
+        drawn = np.bincount(flat_numbers, minlength=40) > 0
         
-        # 正規化頻率
+        # 正規化頻率（整個陣列一次運算）
         if total_weight > 0:
-            for num in weighted_freq:
-                weighted_freq[num] = weighted_freq[num] / total_weight
+            weighted_freq /= total_weight
         
         logger.info(f"✅ 完成時間加權分析，衰減係數: {decay_factor}")
         
-        return dict(weighted_freq)
+        if not drawn.any():
+            return None
+        weighted_freq[~drawn] = np.nan
+        return weighted_freq
         
     except Exception as e:
         logger.error(f"❌ 時間加權計算失敗: {e}")
-        return {}
+        return None
 
 
 def check_odd_even_ratio(numbers):
@@ -214,19 +298,16 @@ def calculate_score(numbers, hot_numbers, weekday_strong_numbers, special_tail_n
 
 
 def _number_frequency_scores(df, decay=EV_DECAY, lookback_days=EV_LOOKBACK_DAYS):
-    scores = np.zeros(40, dtype=float)
     max_date = df['日期'].max()
     cutoff_date = max_date - pd.Timedelta(days=lookback_days)
     recent_df = df[df['日期'] >= cutoff_date].copy()
     if len(recent_df) == 0:
         recent_df = df.copy()
-    days_ago = (max_date - recent_df['日期']).dt.days.clip(lower=0).to_numpy()
-    row_weights = np.power(decay, days_ago)
+    days_ago = np.maximum(_days_before(max_date, recent_df['日期']), 0)
+    row_weights = _decay_weights(days_ago, decay)
     draw_matrix = recent_df[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int)
-    for row_idx in range(draw_matrix.shape[0]):
-        w = row_weights[row_idx]
-        for num in draw_matrix[row_idx]:
-            scores[num] += w
+    # 號碼只有 1-39，直接以 bincount 累加（每期權重對應到該期五個號碼）
+    scores = np.bincount(draw_matrix.ravel(), weights=np.repeat(row_weights, draw_matrix.shape[1]), minlength=40)
     scores[0] = -1e9
     return scores
 
@@ -238,10 +319,8 @@ def _weekday_scores(df, weekday):
         scores[0] = -1e9
         return scores
     draw_matrix = sub[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int)
-    for row in draw_matrix:
-        for num in row:
-            scores[num] += 1.0
-    scores = scores / len(sub)
+    # 號碼只有 1-39，直接以 bincount 計次
+    scores = np.bincount(draw_matrix.ravel(), minlength=40) / len(sub)
     scores[0] = -1e9
     return scores
 
@@ -253,10 +332,7 @@ def _momentum_scores(df, k=EV_MOMENTUM_K):
         scores[0] = -1e9
         return scores
     draw_matrix = sub[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int)
-    for row in draw_matrix:
-        for num in row:
-            scores[num] += 1.0
-    scores = scores / len(sub)
+    scores = np.bincount(draw_matrix.ravel(), minlength=40) / len(sub)
     scores[0] = -1e9
     return scores
 
@@ -281,54 +357,63 @@ def _overdue_scores(df, cap=60):
     return scores
 
 
-def suggest_ev_numbers(df, n, target_weekday):
+def _build_ev_scores(df, target_weekday):
     base = _number_frequency_scores(df, decay=EV_DECAY, lookback_days=EV_LOOKBACK_DAYS)
     weekday = _weekday_scores(df, target_weekday)
     momentum = _momentum_scores(df, k=EV_MOMENTUM_K)
     overdue = _overdue_scores(df)
-    final_scores = base + (EV_W_WEEKDAY * weekday) + (EV_W_MOMENTUM * momentum) + (EV_W_OVERDUE * overdue)
-    picked = np.argsort(final_scores)[::-1][:n]
+    return base + (EV_W_WEEKDAY * weekday) + (EV_W_MOMENTUM * momentum) + (EV_W_OVERDUE * overdue)
+
+
+def suggest_ev_numbers(df, n, target_weekday, scores=None):
+    if scores is None:
+        scores = _build_ev_scores(df, target_weekday)
+    # 只需要前 n 名且最後會重新排序，argpartition 不必整列排序
+    picked = np.argpartition(-scores, n - 1)[:n]
     return sorted(int(x) for x in picked)
 
 
-def suggest_smart_numbers(df, n, randomness_factor=0.3):
+def suggest_smart_numbers(df, n, randomness_factor=0.3, weighted_freq=None):
     numbers = list(range(1, 40))
-    weighted_freq = compute_weighted_frequency(df)
-    if not weighted_freq:
-        return sorted(np.random.choice(numbers, size=n, replace=False).tolist())
-    weights = np.array([weighted_freq.get(num, 0.001) for num in numbers], dtype=float)
-    noise = np.random.random(len(numbers))
-    weights = weights * (1 - randomness_factor) + noise * randomness_factor
+    if weighted_freq is None:
+        weighted_freq = compute_weighted_frequency_array(df)
+    if weighted_freq is None:
+        return sorted(_RNG.choice(numbers, size=n, replace=False).tolist())
+    # 陣列索引即號碼，取 1-39 的副本（之後原地運算不影響呼叫端的陣列）
+    weights = weighted_freq[1:].astype(float)
+    # weights*(1-r) + noise*r：整段向量在同一個緩衝區內原地運算
+    noise = _RNG.random(len(numbers))
+    noise *= randomness_factor
+    weights *= 1 - randomness_factor
+    weights += noise
     total = weights.sum()
     if total <= 0:
-        return sorted(np.random.choice(numbers, size=n, replace=False).tolist())
-    weights = weights / total
-    selected = np.random.choice(numbers, size=n, replace=False, p=weights)
+        return sorted(_RNG.choice(numbers, size=n, replace=False).tolist())
+    weights /= total
+    # 根據權重不重複抽號（Gumbel-top-k，與逐一依權重抽取的分佈相同）
+    keys = np.log(weights, out=weights)
+    keys += _RNG.gumbel(size=keys.shape)
+    selected = np.asarray(numbers)[np.argpartition(keys, -n)[-n:]]
     return sorted(int(x) for x in selected.tolist())
 
 
-def select_top_weighted_numbers(nine_numbers, df, n=7):
+def select_top_weighted_numbers(nine_numbers, df, n=7, weighted_freq=None):
     """
     從九顆號碼中選取加權最高的七顆
-    使用智能選號的加權邏輯來排序九顆號碼
+    使用智能選號的加權邏輯來排序九顆號碼（可傳入已算好的 weighted_freq 避免重算）
     """
     try:
         if df is not None:
             # 使用與智能選號相同的加權計算
-            weighted_freq = compute_weighted_frequency(df)
-            if weighted_freq:
-                # 計算九顆號碼的加權分數
-                number_scores = []
-                for num in nine_numbers:
-                    score = weighted_freq.get(num, 0.001)
-                    number_scores.append((num, score))
-                
-                # 按加權分數排序（高分在前）
-                number_scores.sort(key=lambda x: x[1], reverse=True)
+            if weighted_freq is None:
+                weighted_freq = compute_weighted_frequency_array(df)
+            if weighted_freq is not None:
+                # 計算九顆號碼的加權分數（陣列索引即號碼）
+                scores = weighted_freq[np.asarray(nine_numbers, dtype=np.int64)]
                 
-                # 選取前七顆
-                top_seven = [num for num, _ in number_scores[:n]]
-                result = sorted(top_seven)
+                # 按加權分數排序（高分在前，同分維持原順序），選取前七顆
+                order = np.argsort(-scores, kind='stable')[:n]
+                result = sorted(int(nine_numbers[i]) for i in order)
                 logger.info(f"🎯 從九顆中選取加權最高的七顆: {result}")
                 return result
     except Exception as e:
@@ -360,59 +445,63 @@ def log_predictions_to_excel(predictions, log_file="fantasy5_prediction_log.xlsx
     # 檢查檔案是否存在
     log_path = Path(log_file)
     
+    # 直接以 openpyxl 操作工作表：只改動目標那一列，不重建整份 DataFrame
+    workbook = None
     if log_path.exists():
         try:
-            existing_df = pd.read_excel(log_file, engine='openpyxl')
+            workbook = load_workbook(log_file)
+            sheet = workbook.worksheets[0]
+            headers = [cell.value for cell in sheet[1]]
             
-            # 檢查是否有相同日期和時間的記錄（避免重複執行產生的記錄）
-            same_datetime_records = existing_df[
-                (existing_df['日期'] == date_str) & 
-                (existing_df['時間'] == time_str)
-            ]
+            # 檢查是否有新欄位需要添加到現有數據
+            for key in log_data:
+                if key not in headers:
+                    headers.append(key)
+                    sheet.cell(row=1, column=len(headers), value=key)
+            col_index = {name: i + 1 for i, name in enumerate(headers)}
             
-            if len(same_datetime_records) > 0:
-                # 有相同日期時間的記錄，更新最新的一筆（避免重複執行覆蓋）
-                latest_same_datetime_index = same_datetime_records.index[-1]
-                
+            # 檢查是否有相同日期和時間的記錄（避免重複執行產生的記錄），取最新的一筆
+            target_row = None
+            date_col, time_col = col_index['日期'], col_index['時間']
+            for row_idx in range(sheet.max_row, 1, -1):
+                if (sheet.cell(row=row_idx, column=date_col).value == date_str and
+                        sheet.cell(row=row_idx, column=time_col).value == time_str):
+                    target_row = row_idx
+                    break
+            
+            if target_row is not None:
+                # 有相同日期時間的記錄，更新該筆（避免重複執行覆蓋）
                 # 保留已驗證的結果（如果有的話）
-                old_record = existing_df.loc[latest_same_datetime_index]
-                if pd.notna(old_record.get('驗證結果', '')) and old_record.get('驗證結果', '') != '':
-                    log_data['驗證結果'] = old_record['驗證結果']
-                    log_data['中獎號碼數'] = old_record['中獎號碼數']
+                old_result = sheet.cell(row=target_row, column=col_index['驗證結果']).value
+                if old_result is not None and old_result != '':
+                    log_data['驗證結果'] = old_result
+                    log_data['中獎號碼數'] = sheet.cell(row=target_row, column=col_index['中獎號碼數']).value
                     log_data['備註'] = f"加州Fantasy 5 EV策略(近一年參數) - 相同時間更新（保留驗證結果） - {os.environ.get('GITHUB_WORKFLOW', 'Unknown')}"
                     logger.info("🔄 更新相同日期時間記錄，保留已驗證結果")
                 else:
                     logger.info("🔄 更新相同日期時間記錄")
-                
-                # 更新該記錄
-                for key, value in log_data.items():
-                    if key in existing_df.columns:
-                        existing_df.loc[latest_same_datetime_index, key] = value
-                    else:
-                        existing_df[key] = ''
-                        existing_df.loc[latest_same_datetime_index, key] = value
-                
-                combined_df = existing_df
             else:
                 # 沒有相同日期時間的記錄，新增一筆
-                new_df = pd.DataFrame([log_data])
-                
-                # 檢查是否有新欄位需要添加到現有數據
-                for col in new_df.columns:
-                    if col not in existing_df.columns:
-                        existing_df[col] = ''
-                
-                combined_df = pd.concat([existing_df, new_df], ignore_index=True)
+                target_row = sheet.max_row + 1
+            
+            # 更新該記錄
+            for key, value in log_data.items():
+                sheet.cell(row=target_row, column=col_index[key], value=value)
                 
         except Exception as e:
             logger.error(f"讀取現有記錄檔案時發生錯誤: {e}")
-            combined_df = pd.DataFrame([log_data])
-    else:
-        combined_df = pd.DataFrame([log_data])
+            workbook = None
+    
+    if workbook is None:
+        # 新檔案使用 write-only 模式直接寫入標題與記錄
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(title='Sheet1')
+        sheet.append(list(log_data.keys()))
+        sheet.append(list(log_data.values()))
     
     # 寫入Excel
     try:
-        combined_df.to_excel(log_file, index=False, engine='openpyxl')
+        workbook.save(log_file)
         logger.info(f"✅ 加州Fantasy 5預測記錄已保存到: {log_file}")
         logger.info(f"   記錄時間: {date_str} {time_str}")
         return True
@@ -440,13 +529,12 @@ def is_prediction_day(check_date=None):
     # 加州Fantasy 5每日開獎，包括週日
     is_predict_day = True
     
-    weekday_names = ['週一', '週二', '週三', '週四', '週五', '週六', '週日']
-    logger.info(f"📅 檢查日期: {check_date.strftime('%Y-%m-%d')} ({weekday_names[check_date.weekday()]})")
-    
-    if is_predict_day:
-        logger.info(f"✅ {weekday_names[check_date.weekday()]} 執行加州Fantasy 5預測（每日開獎）")
-    else:
-        logger.info(f"⏸️ {weekday_names[check_date.weekday()]} 跳過預測")
+    # 日誌未開啟 INFO 時略過日期格式化
+    if logger.isEnabledFor(logging.INFO):
+        weekday_names = ['週一', '週二', '週三', '週四', '週五', '週六', '週日']
+        weekday = check_date.weekday()
+        logger.info(f"📅 檢查日期: {check_date.strftime('%Y-%m-%d')} ({weekday_names[weekday]})")
+        logger.info(f"✅ {weekday_names[weekday]} 執行加州Fantasy 5預測（每日開獎）")
     
     return is_predict_day
 
@@ -482,12 +570,17 @@ def main():
         # 獲取今天星期
         today_weekday = datetime.now().weekday()
         
-        smart_9 = suggest_smart_numbers(df, n=9, randomness_factor=0.3)
-        ev_9 = suggest_ev_numbers(df, n=9, target_weekday=today_weekday)
+        # 時間加權頻率只算一次，九顆與七顆智能選號共用
+        weighted_freq = compute_weighted_frequency_array(df)
+        
+        smart_9 = suggest_smart_numbers(df, n=9, randomness_factor=0.3, weighted_freq=weighted_freq)
+        # EV 分數只算一次，九顆與七顆共用
+        ev_scores = _build_ev_scores(df, today_weekday)
+        ev_9 = suggest_ev_numbers(df, n=9, target_weekday=today_weekday, scores=ev_scores)
         
         # 生成七顆策略（保留智能 + EV，不使用平衡策略）
-        smart_7 = select_top_weighted_numbers(smart_9, df, n=7)
-        ev_7 = suggest_ev_numbers(df, n=7, target_weekday=today_weekday)
+        smart_7 = select_top_weighted_numbers(smart_9, df, n=7, weighted_freq=weighted_freq)
+        ev_7 = suggest_ev_numbers(df, n=7, target_weekday=today_weekday, scores=ev_scores)
         
         # 儲存結果
         predictions['smart_9'] = smart_9
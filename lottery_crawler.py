@@ -3,8 +3,12 @@
 # --------------------------------------------------------
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 import pandas as pd
+import numpy as np
 from io import BytesIO
 from pathlib import Path
 from datetime import datetime, timedelta
@@ -12,6 +16,8 @@ import re
 import time
 import json
 import sys
+import shutil
+import tempfile
 import traceback
 
 # 嘗試導入 TaiwanLotteryCrawler 作為備用
@@ -23,81 +29,199 @@ except ImportError:
     TAIWAN_LOTTERY_AVAILABLE = False
     print("⚠️ TaiwanLotteryCrawler 套件不可用，使用原有爬蟲方法")
 
+# 嘗試導入 selectolax 作為較快的 HTML 解析器，不可用時改用 lxml
+try:
+    from selectolax.parser import HTMLParser
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    SELECTOLAX_AVAILABLE = False
+
+# 嘗試導入 python-calamine (Rust) 作為較快的 Excel 讀取引擎
+try:
+    import python_calamine  # noqa: F401
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
+# pilio 表格解析用的正規表示式 (例如: 2025/08/30(六)、"04, 05, 07, 13, 14")
+_DATE_RE = re.compile(r'(\d{4}/\d{2}/\d{2})\(([一二三四五六日])\)')
+_NUM_RE = re.compile(r'\d+')
+
+# Excel 檔案開頭的魔術位元組：xlsx 為 zip (PK\x03\x04)，舊版 xls 為 OLE 複合文件
+_EXCEL_MAGIC = (b'PK\x03\x04', b'\xd0\xcf\x11\xe0')
+
+# 星期對照（依 datetime.weekday() 索引）
+_WEEKDAY_MAP = ('一', '二', '三', '四', '五', '六', '日')
+
+# standardize_columns 使用的欄位關鍵字
+_DATE_KEYS = ('日期', 'date', '開獎日')
+_PERIOD_KEYS = ('期數', '期別', 'period')
+_WEEKDAY_KEYS = ('星期', 'day', '週')
+_NUMBER_KEYS = ('號碼', '開獎號碼', 'number')
+_ORDINAL_KEYS = (('1', 'first'), ('2', 'second'), ('3', 'third'), ('4', 'fourth'), ('5', 'fifth'))
+
+def _read_excel(source, **kwargs):
+    """讀取Excel：優先使用 calamine 引擎，失敗時退回 openpyxl"""
+    if CALAMINE_AVAILABLE:
+        try:
+            return pd.read_excel(source, engine='calamine', **kwargs)
+        except Exception:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+    return pd.read_excel(source, engine='openpyxl', **kwargs)
+
 class Lottery539Crawler:
     def __init__(self):
         self.base_url = "https://www.pilio.idv.tw"
         self.lottery_page = "https://www.pilio.idv.tw/lto539/list.asp"
         self.session = requests.Session()
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Connection': 'keep-alive'
         })
+        
+        # 連線池：同一主機的多次請求共用 TCP/TLS 連線，並對暫時性錯誤自動重試
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # pilio 頁面的 ETag / Last-Modified，待寫檔成功後才保存
+        self._pending_http_cache = None
+    
+    def _load_http_cache(self, cache_file, excel_path):
+        """讀取上次回應的 ETag / Last-Modified，轉為條件式請求標頭
+        
+        只有歷史檔案仍是保存標頭時的同一份（修改時間相同）才使用；
+        檔案被還原或重建時改為一般請求，避免 304 讓舊檔漏掉新開獎
+        """
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            history_mtime_ns = excel_path.stat().st_mtime_ns
+        except (OSError, ValueError):
+            return {}
+        
+        if cached.get('history_mtime_ns') != history_mtime_ns:
+            return {}
+        
+        headers = {}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        return headers
     
-    def crawl_pilio_results(self):
+    def _save_http_cache(self, cache_file, response, excel_path):
+        """保存本次回應的 ETag / Last-Modified 供下次條件式請求使用（連同歷史檔案的修改時間）"""
+        cached = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+        if not any(cached.values()):
+            return
+        try:
+            cached['history_mtime_ns'] = excel_path.stat().st_mtime_ns
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump(cached, f)
+        except OSError as e:
+            print(f"⚠️ 無法保存快取標頭: {e}")
+    
+    def _iter_table_cells(self, content):
+        """逐列產生開獎表格前兩欄的文字 (第一欄, 第二欄)，優先使用 selectolax 解析
+        
+        找到含開獎日期的表格並走完後即停止，不再掃描頁面上其餘的選單/版面表格
+        """
+        if SELECTOLAX_AVAILABLE:
+            tree = HTMLParser(content.decode('utf-8', errors='replace'))
+            for table in tree.css('table'):
+                found = False
+                for tr in table.css('tr'):
+                    cells = [node for node in tr.iter() if node.tag == 'td']
+                    if len(cells) >= 2:
+                        first = cells[0].text(strip=True)
+                        found = found or _DATE_RE.match(first) is not None
+                        yield first, cells[1].text(strip=True)
+                if found:
+                    return
+            return
+        
+        # 備用：以 lxml 解析原始位元組，逐表格以 XPath 取出至少兩欄的表格行
+        root = lxml_html.document_fromstring(
+            content, parser=lxml_html.HTMLParser(encoding='utf-8')
+        )
+        for table in root.iter('table'):
+            found = False
+            for row in table.xpath('.//tr[count(td)>=2]'):
+                cells = row.xpath('./td')
+                first = ''.join(t.strip() for t in cells[0].itertext())
+                found = found or _DATE_RE.match(first) is not None
+                yield first, ''.join(t.strip() for t in cells[1].itertext())
+            if found:
+                return
+    
+    def crawl_pilio_results(self, excel_file="lottery_hist.xlsx"):
         """從pilio網站爬取539開獎結果"""
         try:
             print("🔍 正在從pilio網站獲取539開獎資料...")
-            response = self.session.get(self.lottery_page, timeout=10)
-            response.raise_for_status()
-            
-            # 設定正確的編碼
-            response.encoding = 'utf-8'
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
             
-            # 尋找包含開獎結果的表格
-            lottery_data = []
+            # 已有歷史檔案時帶上快取標頭，頁面未變動則伺服器回 304 不含內容
+            excel_path = Path(excel_file)
+            cache_file = excel_path.with_suffix('.etag.json')
+            headers = self._load_http_cache(cache_file, excel_path) if excel_path.exists() else {}
             
-            # 找到包含開獎號碼的表格行
-            tables = soup.find_all('table')
+            response = self.session.get(self.lottery_page, timeout=10, headers=headers)
+            response.raise_for_status()
             
-            for table in tables:
-                rows = table.find_all('tr')
-                for row in rows:
-                    cells = row.find_all('td')
-                    if len(cells) >= 2:
-                        # 檢查第一欄是否為日期格式
-                        date_cell = cells[0].get_text(strip=True)
-                        numbers_cell = cells[1].get_text(strip=True)
-                        
-                        # 檢查日期格式 (例如: 2025/08/30(六))
-                        date_match = re.match(r'(\d{4}/\d{2}/\d{2})\([一二三四五六日]\)', date_cell)
-                        if date_match:
-                            date_str = date_match.group(1)
-                            
-                            # 解析號碼 (例如: "04, 05, 07, 13, 14")
-                            numbers = re.findall(r'\d+', numbers_cell)
-                            if len(numbers) == 5:
-                                # 轉換為整數並確保是兩位數格式
-                                formatted_numbers = [int(num) for num in numbers]
-                                
-                                lottery_data.append({
-                                    '日期': date_str,
-                                    '星期': date_cell.split('(')[1].split(')')[0] if '(' in date_cell else '',
-                                    '號碼1': formatted_numbers[0],
-                                    '號碼2': formatted_numbers[1],
-                                    '號碼3': formatted_numbers[2],
-                                    '號碼4': formatted_numbers[3],
-                                    '號碼5': formatted_numbers[4]
-                                })
-            
-            if lottery_data:
-                print(f"✅ 成功解析 {len(lottery_data)} 期開獎資料")
+            if response.status_code == 304:
+                print("📋 pilio頁面自上次爬取後沒有變動，沿用現有歷史資料")
+                return _read_excel(excel_file)
+            
+            # 尋找包含開獎結果的表格，逐欄累積以便一次建立DataFrame
+            dates, weekdays = [], []
+            number_columns = ([], [], [], [], [])
+            
+            for date_cell, numbers_cell in self._iter_table_cells(response.content):
+                # 檢查日期格式 (例如: 2025/08/30(六))
+                date_match = _DATE_RE.match(date_cell)
+                if date_match:
+                    # 解析號碼 (例如: "04, 05, 07, 13, 14")
+                    numbers = _NUM_RE.findall(numbers_cell)
+                    if len(numbers) == 5:
+                        dates.append(date_match.group(1))
+                        weekdays.append(date_match.group(2))
+                        for column, num in zip(number_columns, numbers):
+                            column.append(int(num))
+            
+            if dates:
+                print(f"✅ 成功解析 {len(dates)} 期開獎資料")
                 
                 # 顯示最新幾期作為確認
                 print("\n最新5期開獎資料:")
-                for i, data in enumerate(lottery_data[:5]):
-                    numbers = [data['號碼1'], data['號碼2'], data['號碼3'], data['號碼4'], data['號碼5']]
-                    print(f"   {data['日期']} ({data['星期']}): {numbers}")
+                for i in range(min(5, len(dates))):
+                    numbers = [column[i] for column in number_columns]
+                    print(f"   {dates[i]} ({weekdays[i]}): {numbers}")
                 
-                # 轉換為DataFrame
-                df = pd.DataFrame(lottery_data)
+                # 轉換為DataFrame（號碼範圍1-39，使用int8即可）
+                df = pd.DataFrame({
+                    '日期': dates,
+                    '星期': weekdays,
+                    **{f'號碼{i+1}': np.asarray(column, dtype=np.int8)
+                       for i, column in enumerate(number_columns)}
+                })
                 
-                # 轉換日期格式
-                df['日期'] = pd.to_datetime(df['日期'])
+                # 轉換日期格式（已知格式，走向量化解析）
+                df['日期'] = pd.to_datetime(df['日期'], format='%Y/%m/%d', cache=True)
                 
                 # 按日期排序（舊的在前）
                 df = df.sort_values('日期').reset_index(drop=True)
                 
+                # 待歷史檔案成功更新後才寫入快取標頭，避免寫檔失敗時下次被 304 略過
+                self._pending_http_cache = (cache_file, response, excel_path)
+                
                 return df
             else:
                 print("❌ 未找到開獎資料")
@@ -128,22 +252,15 @@ class Lottery539Crawler:
                     response = self.session.get(url, timeout=10)
                     response.raise_for_status()
                     
-                    soup = BeautifulSoup(response.text, 'html.parser')
+                    soup = BeautifulSoup(response.content, 'lxml')
                     
-                    # 方法1: 尋找包含"539"或"今彩539"的連結
+                    # 單次掃描所有連結：文字或網址含"539"者即為候選
+                    # （涵蓋今彩539、lotto539、539的Excel檔案及「開獎結果/歷史資料/下載」等連結）
                     for link in soup.find_all('a', href=True):
                         link_text = link.text.strip()
-                        href = link.get('href', '')
+                        href = link['href']
                         
-                        if any(keyword in link_text.lower() for keyword in ['539', '今彩539', 'lotto539']):
-                            if not href.startswith('http'):
-                                href = self.base_url + href
-                            links.append({
-                                'text': link_text,
-                                'url': href,
-                                'source': url
-                            })
-                        elif any(keyword in href.lower() for keyword in ['539', 'lotto539']):
+                        if '539' in link_text or '539' in href:
                             if not href.startswith('http'):
                                 href = self.base_url + href
                             links.append({
@@ -152,43 +269,15 @@ class Lottery539Crawler:
                                 'source': url
                             })
                     
-                    # 方法2: 尋找Excel檔案連結
-                    for link in soup.find_all('a', href=True):
-                        href = link.get('href', '')
-                        if href.endswith('.xlsx') or href.endswith('.xls'):
-                            if any(keyword in href.lower() for keyword in ['539', 'lotto539']):
-                                if not href.startswith('http'):
-                                    href = self.base_url + href
-                                links.append({
-                                    'text': f"Excel檔案: {link.text.strip() or href.split('/')[-1]}",
-                                    'url': href,
-                                    'source': url
-                                })
-                    
-                    # 方法3: 尋找包含"開獎結果"和"下載"的連結
-                    for link in soup.find_all('a', href=True):
-                        link_text = link.text.strip()
-                        if any(keyword in link_text for keyword in ['開獎結果', '歷史資料', '下載']) and '539' in link_text:
-                            href = link.get('href', '')
-                            if not href.startswith('http'):
-                                href = self.base_url + href
-                            links.append({
-                                'text': link_text,
-                                'url': href,
-                                'source': url
-                            })
-                    
                 except Exception as e:
                     print(f"   無法存取 {url}: {e}")
                     continue
             
-            # 去重複
-            unique_links = []
-            seen_urls = set()
+            # 去重複（以網址為鍵，保留最先出現的連結；dict 會維持插入順序）
+            unique_by_url = {}
             for link in links:
-                if link['url'] not in seen_urls:
-                    unique_links.append(link)
-                    seen_urls.add(link['url'])
+                unique_by_url.setdefault(link['url'], link)
+            unique_links = list(unique_by_url.values())
             
             if unique_links:
                 print(f"✅ 找到 {len(unique_links)} 個相關連結:")
@@ -208,16 +297,23 @@ class Lottery539Crawler:
         """下載開獎資料檔案"""
         try:
             print(f"📥 正在下載開獎資料...")
-            response = self.session.get(download_url, timeout=30)
-            response.raise_for_status()
+            with self.session.get(download_url, timeout=30, stream=True) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('content-type', '')
+                
+                # 串流寫入暫存檔：小檔留在記憶體，大檔自動轉存磁碟
+                buffer = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+                response.raw.decode_content = True
+                shutil.copyfileobj(response.raw, buffer, length=64 * 1024)
             
-            # 檢查是否為Excel檔案
-            content_type = response.headers.get('content-type', '')
-            if 'excel' not in content_type and 'spreadsheet' not in content_type:
-                print(f"⚠️ 檔案類型可能不正確: {content_type}")
+            print(f"✅ 下載完成，檔案大小: {buffer.tell()} bytes")
+            buffer.seek(0)
             
-            print(f"✅ 下載完成，檔案大小: {len(response.content)} bytes")
-            return response.content
+            # 以檔頭魔術位元組檢查是否為Excel檔案（content-type 標頭不一定可靠）
+            if not buffer.read(8).startswith(_EXCEL_MAGIC):
+                print(f"⚠️ 檔案類型可能不正確: {content_type}")
+            buffer.seek(0)
+            return buffer
             
         except Exception as e:
             print(f"❌ 下載檔案時發生錯誤: {e}")
@@ -228,12 +324,17 @@ class Lottery539Crawler:
         try:
             print("🔍 正在解析開獎資料...")
             
+            # 接受位元組或檔案物件（download_lottery_data 回傳的暫存檔可直接讀取）
+            if isinstance(excel_content, (bytes, bytearray)):
+                excel_content = BytesIO(excel_content)
+            
             # 嘗試讀取Excel檔案
             try:
-                df = pd.read_excel(BytesIO(excel_content), engine='openpyxl')
+                df = _read_excel(excel_content)
             except:
-                # 如果openpyxl失敗，嘗試xlrd
-                df = pd.read_excel(BytesIO(excel_content), engine='xlrd')
+                # 如果calamine/openpyxl都失敗，嘗試xlrd
+                excel_content.seek(0)
+                df = pd.read_excel(excel_content, engine='xlrd')
             
             print(f"📊 原始資料包含 {len(df)} 行, {len(df.columns)} 列")
             print(f"欄位名稱: {list(df.columns)}")
@@ -267,37 +368,29 @@ class Lottery539Crawler:
                 col_str = str(col).strip()
                 
                 # 日期欄位
-                if any(keyword in col_str for keyword in ['日期', 'date', '開獎日']):
+                if any(keyword in col_str for keyword in _DATE_KEYS):
                     column_mapping[col] = '日期'
                 # 期數欄位
-                elif any(keyword in col_str for keyword in ['期數', '期別', 'period']):
+                elif any(keyword in col_str for keyword in _PERIOD_KEYS):
                     column_mapping[col] = '期數'
                 # 星期欄位
-                elif any(keyword in col_str for keyword in ['星期', 'day', '週']):
+                elif any(keyword in col_str for keyword in _WEEKDAY_KEYS):
                     column_mapping[col] = '星期'
                 # 開獎號碼欄位
-                elif any(keyword in col_str for keyword in ['號碼', '開獎號碼', 'number']):
-                    if '1' in col_str or 'first' in col_str.lower():
-                        column_mapping[col] = '號碼1'
-                    elif '2' in col_str or 'second' in col_str.lower():
-                        column_mapping[col] = '號碼2'
-                    elif '3' in col_str or 'third' in col_str.lower():
-                        column_mapping[col] = '號碼3'
-                    elif '4' in col_str or 'fourth' in col_str.lower():
-                        column_mapping[col] = '號碼4'
-                    elif '5' in col_str or 'fifth' in col_str.lower():
-                        column_mapping[col] = '號碼5'
+                elif any(keyword in col_str for keyword in _NUMBER_KEYS):
+                    col_lower = col_str.lower()
+                    for i, (digit, ordinal) in enumerate(_ORDINAL_KEYS):
+                        if digit in col_str or ordinal in col_lower:
+                            column_mapping[col] = f'號碼{i+1}'
+                            break
             
             # 如果找不到明確的號碼欄位，嘗試其他方法
             if not any('號碼' in v for v in column_mapping.values()):
-                # 尋找數字欄位
-                numeric_cols = []
-                for col in df.columns:
-                    if df[col].dtype in ['int64', 'float64']:
-                        # 檢查數值範圍是否合理（1-39）
-                        valid_range = df[col].dropna().between(1, 39).all()
-                        if valid_range:
-                            numeric_cols.append(col)
+                # 尋找數字欄位，並一次檢查所有數值是否落在合理範圍（1-39，允許空值）
+                num_df = df.select_dtypes(include=[np.number])
+                values = num_df.to_numpy(dtype=np.float64)
+                in_range = ((values >= 1) & (values <= 39)) | np.isnan(values)
+                numeric_cols = list(num_df.columns[in_range.all(axis=0)])
                 
                 # 如果找到5個數字欄位，假設為開獎號碼
                 if len(numeric_cols) >= 5:
@@ -334,30 +427,57 @@ class Lottery539Crawler:
             
             if excel_path.exists():
                 # 讀取現有資料
-                existing_df = pd.read_excel(excel_file, engine='openpyxl')
+                existing_df = _read_excel(excel_file)
                 print(f"現有資料: {len(existing_df)} 期")
                 
-                # 合併資料
-                combined_df = pd.concat([existing_df, new_data], ignore_index=True)
-                
-                # 去重（基於日期）
-                before_count = len(combined_df)
-                if '日期' in combined_df.columns:
-                    combined_df = combined_df.drop_duplicates(subset=['日期'], keep='last')
+                if '日期' in existing_df.columns and '日期' in new_data.columns:
+                    # 無法解析的日期不列入比對，原儲存格照原樣保留，不讓單一錯誤儲存格擋下新開獎的寫入
+                    existing_dates = pd.to_datetime(existing_df['日期'], errors='coerce')
+                    bad_existing = existing_dates.isna() & existing_df['日期'].notna()
+                    if bad_existing.any():
+                        print(f"⚠️ 現有資料中有 {int(bad_existing.sum())} 筆日期無法解析，保留原值但不列入比對")
+                        existing_df['日期'] = existing_dates.astype(object).where(~bad_existing, existing_df['日期'])
+                    else:
+                        existing_df['日期'] = existing_dates
+                    new_data = new_data.copy()
+                    new_data['日期'] = pd.to_datetime(new_data['日期'], errors='coerce')
+                    bad_new = int(new_data['日期'].isna().sum())
+                    if bad_new > 0:
+                        print(f"⚠️ 略過 {bad_new} 筆日期無法解析的新資料")
+                        new_data = new_data.dropna(subset=['日期'])
+                    
+                    # 以開獎日(datetime64[D])差集過濾已存在的資料，缺漏的舊日期（如手動補登）也會補上
+                    existing_days = existing_dates.dropna().to_numpy().astype('datetime64[D]')
+                    new_days = new_data['日期'].to_numpy().astype('datetime64[D]')
+                    new_rows = new_data[~np.isin(new_days, existing_days)]
+                    new_rows = new_rows.drop_duplicates(subset=['日期'], keep='last')
+                    
+                    skipped_count = len(new_data) - len(new_rows)
+                    if skipped_count > 0:
+                        print(f"🔄 略過 {skipped_count} 筆已存在的資料")
+                    
+                    if len(new_rows) == 0:
+                        print("📋 沒有新的開獎記錄，檔案維持不變")
+                        return True
+                    
+                    combined_df = pd.concat(
+                        [existing_df, new_rows.sort_values('日期')], ignore_index=True
+                    )
+                    
+                    # 只有補登到既有日期之前時才需要整體重新排序
+                    if new_rows['日期'].min() < existing_dates.max():
+                        combined_df = combined_df.sort_values(
+                            '日期', kind='stable', key=lambda col: pd.to_datetime(col, errors='coerce')
+                        ).reset_index(drop=True)
                 else:
+                    # 沒有日期欄位時，只能整份合併後去重
+                    combined_df = pd.concat([existing_df, new_data], ignore_index=True)
+                    before_count = len(combined_df)
                     combined_df = combined_df.drop_duplicates()
-                after_count = len(combined_df)
-                
-                if before_count > after_count:
-                    print(f"🔄 移除了 {before_count - after_count} 筆重複資料")
-                
-                # 按日期排序（如果有日期欄位）
-                if '日期' in combined_df.columns:
-                    try:
-                        combined_df['日期'] = pd.to_datetime(combined_df['日期'])
-                        combined_df = combined_df.sort_values('日期')
-                    except:
-                        print("⚠️ 無法按日期排序")
+                    after_count = len(combined_df)
+                    
+                    if before_count > after_count:
+                        print(f"🔄 移除了 {before_count - after_count} 筆重複資料")
                 
                 final_df = combined_df
                 
@@ -365,8 +485,9 @@ class Lottery539Crawler:
                 print("📄 創建新的Excel檔案")
                 final_df = new_data
             
-            # 儲存檔案
-            final_df.to_excel(excel_file, index=False, engine='openpyxl')
+            # 儲存檔案（xlsxwriter 只寫不讀，比 openpyxl 少建一整套儲存格物件）
+            with pd.ExcelWriter(excel_file, engine='xlsxwriter') as writer:
+                final_df.to_excel(writer, index=False)
             print(f"✅ 成功更新 {excel_file}，共 {len(final_df)} 期資料")
             
             # 顯示最新幾期資料
@@ -390,19 +511,29 @@ class Lottery539Crawler:
             "https://www.taiwanlottery.com/static/upload/lotto539.xlsx"
         ]
         
+        def fetch(url):
+            # 先只讀取檔頭 8 bytes，確認是Excel才下載其餘內容，避免白白傳輸錯誤頁面
+            with self.session.get(url, timeout=15, stream=True) as response:
+                if response.status_code != 200:
+                    return None
+                response.raw.decode_content = True
+                head = response.raw.read(8)
+                if not head.startswith(_EXCEL_MAGIC):
+                    return None
+                return head + response.raw.read()
+        
         print("📥 嘗試直接下載已知的539資料URL...")
+        # 依優先順序逐一嘗試，檔頭不符的網址只傳輸 8 bytes 即略過
         for url in direct_urls:
             try:
                 print(f"   嘗試: {url}")
-                response = self.session.get(url, timeout=15)
-                if response.status_code == 200:
-                    content_type = response.headers.get('content-type', '')
-                    if 'excel' in content_type or 'spreadsheet' in content_type or len(response.content) > 1000:
-                        print(f"✅ 成功下載: {url}")
-                        return response.content
+                content = fetch(url)
             except Exception as e:
                 print(f"   失敗: {e}")
                 continue
+            if content is not None:
+                print(f"✅ 成功下載: {url}")
+                return content
         
         print("❌ 直接下載失敗")
         return None
@@ -419,7 +550,7 @@ class Lottery539Crawler:
             # 檢查是否已有歷史檔案
             excel_path = Path(excel_file)
             if excel_path.exists():
-                existing_df = pd.read_excel(excel_file, engine='openpyxl')
+                existing_df = _read_excel(excel_file)
                 existing_df['日期'] = pd.to_datetime(existing_df['日期'])
                 latest_date = existing_df['日期'].max()
                 print(f"📊 現有歷史記錄: {len(existing_df)} 筆，最新日期: {latest_date.date()}")
@@ -457,26 +588,23 @@ class Lottery539Crawler:
             if current_month_data and len(current_month_data) > 0:
                 print(f"📅 獲取到 {len(current_month_data)} 筆當月記錄")
                 
+                # 一次轉換所有記錄的日期（逐筆判斷格式），只略過真正無法解析的記錄
+                records_df = pd.DataFrame(current_month_data)
+                records_df['日期'] = pd.to_datetime(records_df['開獎日期'], format='mixed', errors='coerce', cache=True)
+                unparsed_count = int(records_df['日期'].isna().sum())
+                if unparsed_count > 0:
+                    print(f"⚠️ 略過 {unparsed_count} 筆無法解析開獎日期的記錄")
+                    records_df = records_df.dropna(subset=['日期'])
+                
                 # 如果有現有記錄，只保留比最新記錄更新的資料
                 if excel_path.exists():
-                    filtered_data = []
-                    for record in current_month_data:
-                        try:
-                            record_date = pd.to_datetime(record['開獎日期'])
-                            if record_date > latest_date:
-                                filtered_data.append(record)
-                        except:
-                            continue
+                    records_df = records_df[records_df['日期'] > latest_date]
                     
-                    if filtered_data:
-                        print(f"🆕 找到 {len(filtered_data)} 筆新記錄")
-                        all_new_data = filtered_data
+                    if len(records_df) > 0:
+                        print(f"🆕 找到 {len(records_df)} 筆新記錄")
                     else:
                         print("📋 沒有比現有記錄更新的資料")
                         return True  # 沒有新資料但不算失敗
-                else:
-                    all_new_data = current_month_data
-                    
             else:
                 print("❌ 無法獲取當月記錄")
                 print(f"   當前日期: {current_date.date()}")
@@ -490,37 +618,22 @@ class Lottery539Crawler:
                     print(f"   返回資料類型: {type(current_month_data)}")
                 return False
             
-            if all_new_data:
-                print(f"✅ 準備更新 {len(all_new_data)} 筆新記錄")
+            if len(records_df) > 0:
+                print(f"✅ 準備更新 {len(records_df)} 筆新記錄")
                 
-                # 轉換為標準格式
-                standardized_data = []
-                for record in all_new_data:
-                    try:
-                        draw_date = pd.to_datetime(record['開獎日期'])
-                        winning_numbers = record['獎號']
-                        
-                        if len(winning_numbers) >= 5:
-                            weekday_map = {0: '一', 1: '二', 2: '三', 3: '四', 4: '五', 5: '六', 6: '日'}
-                            weekday = weekday_map[draw_date.weekday()]
-                            
-                            standardized_record = {
-                                '日期': draw_date,
-                                '星期': weekday,
-                                '號碼1': winning_numbers[0],
-                                '號碼2': winning_numbers[1],
-                                '號碼3': winning_numbers[2],
-                                '號碼4': winning_numbers[3],
-                                '號碼5': winning_numbers[4],
-                                '期別': record.get('期別', '')
-                            }
-                            standardized_data.append(standardized_record)
-                    except Exception as e:
-                        print(f"⚠️ 處理記錄時發生錯誤: {e}")
-                        continue
+                # 轉換為標準格式：獎號至少5個的記錄，逐欄向量化展開
+                records_df = records_df[records_df['獎號'].str.len() >= 5]
+                winning_numbers = records_df['獎號']
                 
-                if standardized_data:
-                    new_df = pd.DataFrame(standardized_data)
+                if len(records_df) > 0:
+                    weekday_index = records_df['日期'].dt.weekday.to_numpy()
+                    new_df = pd.DataFrame({
+                        '日期': records_df['日期'],
+                        '星期': np.asarray(_WEEKDAY_MAP, dtype=object)[weekday_index],
+                        **{f'號碼{i+1}': winning_numbers.str[i] for i in range(5)},
+                        '期別': records_df['期別'].fillna('') if '期別' in records_df.columns else ''
+                    }).reset_index(drop=True)
+                    
                     success = self.update_excel_file(new_df, excel_file)
                     if success:
                         print("✅ 使用 TaiwanLotteryCrawler 更新成功")
@@ -548,10 +661,13 @@ class Lottery539Crawler:
                 print("\n⚠️ TaiwanLotteryCrawler 失敗，嘗試原有方法...")
         
         # 2. 從pilio網站爬取資料（備用方法）
-        lottery_data = self.crawl_pilio_results()
+        lottery_data = self.crawl_pilio_results(excel_file)
         if lottery_data is not None and len(lottery_data) > 0:
             success = self.update_excel_file(lottery_data, excel_file)
             if success:
+                if self._pending_http_cache is not None:
+                    self._save_http_cache(*self._pending_http_cache)
+                    self._pending_http_cache = None
                 print("\n🎉 開獎資料更新完成！")
                 return True
             else:
@@ -574,19 +690,22 @@ def manual_data_entry():
         date_str = input("請輸入開獎日期 (YYYY-MM-DD): ").strip()
         period = input("請輸入期數 (可選): ").strip()
         
-        print("請輸入5個開獎號碼 (1-39):")
-        numbers = []
-        for i in range(5):
-            while True:
-                try:
-                    num = int(input(f"號碼{i+1}: "))
-                    if 1 <= num <= 39:
-                        numbers.append(num)
-                        break
-                    else:
-                        print("請輸入1-39之間的數字")
-                except ValueError:
-                    print("請輸入有效的數字")
+        # 一次輸入5個號碼（空白或逗號分隔），方便以管線批次補登
+        while True:
+            raw = input("請輸入5個開獎號碼 (1-39，空白或逗號分隔): ").replace(',', ' ').split()
+            try:
+                numbers = np.array([int(x) for x in raw], dtype=np.int64)
+            except ValueError:
+                print("請輸入有效的數字")
+                continue
+            
+            if numbers.size != 5:
+                print(f"請輸入剛好5個號碼（目前 {numbers.size} 個）")
+            elif not ((numbers >= 1) & (numbers <= 39)).all():
+                print("請輸入1-39之間的數字")
+            else:
+                numbers = numbers.tolist()
+                break
         
         # 建立資料
         manual_data = {
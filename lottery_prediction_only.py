@@ -6,17 +6,65 @@
 
 import pandas as pd
 import numpy as np
-import random
 from pathlib import Path
 from datetime import datetime
 import os
 import logging
-from collections import defaultdict
+import functools
 from itertools import combinations
+from openpyxl import Workbook, load_workbook
+
+try:
+    import python_calamine  # noqa: F401
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+
+# 539 高機率特徵常數 (根據歷史統計)
+HOT_NUMBERS = [1, 27, 11, 17, 23]  # 熱門號碼
+
+WEEKDAY_STRONG_NUMBERS = {
+    0: [6, 24, 17, 16, 1],      # 週一
+    1: [38, 25, 23, 11, 19],    # 週二
+    2: [38, 6, 1, 34, 23],      # 週三
+    3: [27, 37, 35, 14, 17],    # 週四
+    4: [8, 39, 17, 31, 9],      # 週五
+    5: [8, 35, 24, 4, 20],      # 週六
+}
+
+SPECIAL_TAIL_NUMBERS = [1, 4, 7]  # 特殊尾數
+
+# 以號碼為索引的布林查表（索引 0 不使用），取代逐一比對串列
+HOT_MASK = np.zeros(40, dtype=np.bool_)
+HOT_MASK[HOT_NUMBERS] = True
+TAIL_MASK = np.isin(np.arange(40) % 10, SPECIAL_TAIL_NUMBERS)
+TAIL_MASK[0] = False
+WEEKDAY_STRONG_MASK = np.zeros((7, 40), dtype=np.bool_)
+for _weekday, _strong_nums in WEEKDAY_STRONG_NUMBERS.items():
+    WEEKDAY_STRONG_MASK[_weekday, _strong_nums] = True
+
+# 智能選號的號碼加權倍率：熱門號 x1.3、星期強勢號 x1.2、特殊尾數 x1.1
+BASE_BOOST = np.where(HOT_MASK, 1.3, 1.0) * np.where(TAIL_MASK, 1.1, 1.0)
+BASE_BOOST = BASE_BOOST.astype(np.float32)
+WEEKDAY_BOOST = (BASE_BOOST * np.where(WEEKDAY_STRONG_MASK, 1.2, 1.0)).astype(np.float32)
+
+def _create_rng():
+    """建立選號用的亂數產生器：LOTTERY_SEED 為非負整數時固定種子，格式錯誤則警告並改用隨機種子"""
+    seed = os.environ.get('LOTTERY_SEED')
+    if seed:
+        try:
+            return np.random.default_rng(int(seed))
+        except ValueError:
+            logger.warning(f"⚠️ LOTTERY_SEED 不是有效的非負整數 ({seed!r})，改用隨機種子")
+    return np.random.default_rng()
+
+# 選號共用的亂數產生器（設定 LOTTERY_SEED 環境變數可固定種子以重現選號結果）
+_RNG = _create_rng()
+
 EV_LOOKBACK_DAYS = 240
 EV_DECAY = 0.99
 EV_W_MOMENTUM = 1.5
@@ -27,13 +75,41 @@ EV_W_PAIR = 0.3
 EV_W_REPEAT = 0.25
 EV_W_REGIME = 0.3
 
+# 預測只用到日期與五個號碼欄，讀檔時略過其餘欄位
+HISTORY_COLUMNS = ['日期', '號碼1', '號碼2', '號碼3', '號碼4', '號碼5']
+
 # 從原本的 lottery_analysis.py 複製核心函數
 def load_lottery_excel(excel_path: str):
-    """讀入 .xlsx 開獎紀錄"""
-    df = pd.read_excel(excel_path, engine='openpyxl')
+    """讀入 .xlsx 開獎紀錄（同一程序內依檔案修改時間快取解析結果）"""
+    mtime_ns = Path(excel_path).stat().st_mtime_ns
+    return _load_lottery_excel_cached(str(excel_path), mtime_ns).copy()
+
+
+@functools.lru_cache(maxsize=4)
+def _load_lottery_excel_cached(excel_path, mtime_ns):
+    """實際讀檔與日期轉換（優先使用 calamine 引擎，失敗時退回 openpyxl）"""
+    usecols = lambda col: col in HISTORY_COLUMNS
+    df = None
+    if CALAMINE_AVAILABLE:
+        try:
+            df = pd.read_excel(excel_path, engine='calamine', usecols=usecols)
+        except Exception as e:
+            logger.warning(f"⚠️ calamine 讀取失敗，改用 openpyxl: {e}")
+    if df is None:
+        df = pd.read_excel(excel_path, engine='openpyxl', usecols=usecols)
     
-    # 確保日期欄位是 datetime 類型
-    if '日期' in df.columns:
+    # 號碼不完整的列在讀檔時一次剔除，後續計算不必再逐列檢查空值
+    number_cols = [col for col in HISTORY_COLUMNS[1:] if col in df.columns]
+    if number_cols:
+        incomplete = df[number_cols].isna().any(axis=1)
+        if incomplete.any():
+            logger.warning(f"⚠️ 略過 {int(incomplete.sum())} 筆號碼不完整的記錄")
+            df = df[~incomplete].reset_index(drop=True)
+        # 號碼範圍 1-39，以 int8 儲存
+        df[number_cols] = df[number_cols].astype(np.int8)
+    
+    # 確保日期欄位是 datetime 類型（Excel 日期儲存格已由引擎轉好則略過）
+    if '日期' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['日期']):
         # 嘗試多種日期格式解析
         try:
             df['日期'] = pd.to_datetime(df['日期'], format='mixed', errors='coerce')
@@ -50,15 +126,58 @@ def load_lottery_excel(excel_path: str):
             # 如果轉換失敗，嘗試不指定格式
             df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
     
+    # 依日期排序（舊的在前），後續可用二分搜尋切出近期資料
+    if '日期' in df.columns:
+        df = df.sort_values('日期', kind='stable').reset_index(drop=True)
+    
     return df
 
 
 
+def _days_before(end_date, dates):
+    """end_date 與各筆日期相差的天數：以 datetime64[D] 直接做整數相減，不經 Timedelta 轉換（NaT 為 NaN）"""
+    elapsed = np.datetime64(end_date, 'D') - dates.to_numpy().astype('datetime64[D]')
+    return np.where(np.isnat(elapsed), np.nan, elapsed.astype(float))
+
+
+def _decay_weights(days_ago, decay):
+    """decay ** days_ago 的查表版本：天數皆為整數，先建 decay ** k 表再以索引取值（NaN 天數維持 NaN）"""
+    valid = ~np.isnan(days_ago)
+    days = np.where(valid, days_ago, 0).astype(np.int64)
+    # 表格從最小天數起算，未來日期（負天數）照樣得到 decay ** days，是否截斷由呼叫端決定
+    lo = days.min(initial=0)
+    table = decay ** np.arange(lo, days.max(initial=0) + 1, dtype=float)
+    return np.where(valid, table[days - lo], np.nan)
+
+
 def compute_weighted_frequency(df, decay_factor=0.95, recent_days=365):
     """
     計算時間加權的號碼頻率
     越近期的記錄權重越高，避免資料鈍化問題
     """
+    freq = _compute_weighted_frequency(df, decay_factor, recent_days)
+    if freq is None:
+        return {}
+    # 只回傳出現過的號碼，未出現者由呼叫端以預設值處理
+    return {int(num): float(freq[num]) for num in np.flatnonzero(~np.isnan(freq))}
+
+
+def compute_weighted_frequency_array(df, decay_factor=0.95, recent_days=365, default=0.001):
+    """
+    與 compute_weighted_frequency 相同，但回傳長度 40 的陣列（索引即號碼）
+    未出現的號碼填入 default；計算失敗或沒有資料時回傳 None
+    """
+    freq = _compute_weighted_frequency(df, decay_factor, recent_days)
+    if freq is None:
+        return None
+    return np.where(np.isnan(freq), default, freq)
+
+
+def _compute_weighted_frequency(df, decay_factor, recent_days):
+    """
+    加權頻率的實際計算
+    回傳長度 40 的陣列，未出現的號碼為 NaN；失敗或沒有資料時回傳 None
+    """
     try:
         # 確保日期欄位是 datetime 類型
         if '日期' in df.columns:
@@ -75,45 +194,46 @@ def compute_weighted_frequency(df, decay_factor=0.95, recent_days=365):
         
         # 只取最近的記錄
         cutoff_date = datetime.now() - pd.Timedelta(days=recent_days)
-        recent_df = df[df['日期'] >= cutoff_date].copy()
+        if df['日期'].is_monotonic_increasing:
+            # 已依日期排序：二分搜尋找出起點，以切片取代布林遮罩
+            start = np.searchsorted(df['日期'].to_numpy(), np.datetime64(cutoff_date), side='left')
+            recent_df = df.iloc[start:]
+        else:
+            recent_df = df[df['日期'] >= cutoff_date]
         
         if len(recent_df) == 0:
             logger.warning("⚠️ 沒有足夠的近期記錄，使用全部資料")
-            recent_df = df.copy()
+            recent_df = df
         
         logger.info(f"⚖️ 使用最近 {len(recent_df)} 筆記錄進行加權分析")
         
-        # 計算每筆記錄距今的天數
-        today = datetime.now()
-        recent_df['days_ago'] = (today - recent_df['日期']).dt.days
+        # 計算每筆記錄距今的天數與權重：越近期權重越高
+        days_ago = _days_before(datetime.now(), recent_df['日期'])
+        weights = _decay_weights(days_ago, decay_factor)
+        total_weight = weights.sum()
         
-        # 計算加權頻率
-        weighted_freq = defaultdict(float)
-        total_weight = 0
-        
-        for _, row in recent_df.iterrows():
-            # 計算權重：越近期權重越高
-            weight = decay_factor ** row['days_ago']
-            total_weight += weight
-            
-            # 累加每個號碼的加權頻率
-            for col in ['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']:
-                if pd.notna(row[col]):
-                    number = int(row[col])
-                    weighted_freq[number] += weight
+        # 五個號碼欄堆成 (N, 5) 陣列，略過空值後一次以 bincount 累加加權頻率
+        numbers = recent_df[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=float)
+        mask = ~np.isnan(numbers)
+        flat_numbers = numbers[mask].astype(np.int64)
+        flat_weights = np.broadcast_to(weights[:, None], numbers.shape)[mask]
+        weighted_freq = np.bincount(flat_numbers, weights=flat_weights, minlength=40)
+        drawn = np.bincount(flat_numbers, minlength=40) > 0
         
-        # 正規化頻率
+        # 正規化頻率（整個陣列一次運算）
         if total_weight > 0:
-            for num in weighted_freq:
-                weighted_freq[num] = weighted_freq[num] / total_weight
+            weighted_freq /= total_weight
         
         logger.info(f"✅ 完成時間加權分析，衰減係數: {decay_factor}")
         
-        return dict(weighted_freq)
+        if not drawn.any():
+            return None
+        weighted_freq[~drawn] = np.nan
+        return weighted_freq
         
     except Exception as e:
         logger.error(f"❌ 時間加權計算失敗: {e}")
-        return {}
+        return None
 
 
 def check_odd_even_ratio(numbers):
@@ -139,13 +259,17 @@ def has_consecutive(numbers):
     return False
 
 
-def count_hot_numbers(numbers, hot_list=[1, 27, 11, 17, 23]):
+def count_hot_numbers(numbers, hot_list=HOT_NUMBERS):
     """計算包含多少個熱門號"""
+    if hot_list is HOT_NUMBERS:
+        return int(HOT_MASK[numbers].sum())
     return sum(1 for n in numbers if n in hot_list)
 
 
-def count_special_tails(numbers, special_tails=[1, 4, 7]):
+def count_special_tails(numbers, special_tails=SPECIAL_TAIL_NUMBERS):
     """計算有多少個號碼的尾數是 1, 4, 7"""
+    if special_tails is SPECIAL_TAIL_NUMBERS:
+        return int(TAIL_MASK[numbers].sum())
     return sum(1 for n in numbers if (n % 10) in special_tails)
 
 
@@ -161,16 +285,6 @@ def apply_high_prob_filters(numbers, target_weekday=None, require_consecutive=Fa
     Returns:
         (通過過濾, 分數)
     """
-    # 星期強勢號碼（根據歷史統計）
-    weekday_strong_numbers = {
-        0: [6, 24, 17, 16, 1],      # 週一
-        1: [38, 25, 23, 11, 19],    # 週二
-        2: [38, 6, 1, 34, 23],      # 週三
-        3: [27, 37, 35, 14, 17],    # 週四
-        4: [8, 39, 17, 31, 9],      # 週五
-        5: [8, 35, 24, 4, 20],      # 週六
-    }
-    
     score = 0
     reasons = []
     
@@ -194,8 +308,7 @@ def apply_high_prob_filters(numbers, target_weekday=None, require_consecutive=Fa
     
     # 4. 檢查星期強勢號 (加分項)
     if target_weekday is not None:
-        strong_nums = weekday_strong_numbers.get(target_weekday, [])
-        strong_count = sum(1 for n in numbers if n in strong_nums)
+        strong_count = int(WEEKDAY_STRONG_MASK[target_weekday, numbers].sum())
         if strong_count >= 1:
             score += min(strong_count * 5, 15)
             reasons.append(f"星期x{strong_count}✓")
@@ -217,8 +330,54 @@ def apply_high_prob_filters(numbers, target_weekday=None, require_consecutive=Fa
     return True, score
 
 
+def _batch_high_prob_filters(rows, target_weekday=None, require_consecutive=False):
+    """
+    apply_high_prob_filters 的批次版本，一次評估多組已排序的候選號碼
+    
+    Args:
+        rows: (K, n) 已逐列排序的號碼陣列
+    
+    Returns:
+        (通過過濾的布林陣列, 分數陣列)
+    """
+    first_five = rows[:, :5]
+    
+    # 1-2. 和值與奇偶比例 (必須)：先以這兩項便宜的檢查淘汰候選組合
+    sums = first_five.sum(axis=1)
+    odd_counts = (first_five & 1).sum(axis=1)
+    passed = (sums >= 83) & (sums <= 116) & ((odd_counts == 2) | (odd_counts == 3))
+    scores = np.zeros(len(rows), dtype=int)
+    if not passed.any():
+        return passed, scores
+    
+    # 其餘加分項只計算通過必要條件的組合
+    kept = rows[passed]
+    kept_scores = np.full(len(kept), 60)
+    
+    # 3. 熱門號 (加分項)
+    kept_scores += np.minimum(HOT_MASK[kept].sum(axis=1) * 10, 20)
+    
+    # 4. 星期強勢號 (加分項)
+    if target_weekday is not None:
+        kept_scores += np.minimum(WEEKDAY_STRONG_MASK[target_weekday][kept].sum(axis=1) * 5, 15)
+    
+    # 5. 連號：排序後相鄰差為 1 即有連號
+    has_consec = (np.diff(kept, axis=1) == 1).any(axis=1)
+    if require_consecutive:
+        kept_scores += np.where(has_consec, 10, -10)
+    else:
+        kept_scores += np.where(has_consec, 10, 0)
+    
+    # 6. 特殊尾數 (加分項)
+    tail_counts = TAIL_MASK[kept].sum(axis=1)
+    kept_scores += np.where(tail_counts >= 2, np.minimum(tail_counts * 3, 10), 0)
+    
+    scores[passed] = kept_scores
+    return passed, scores
+
+
 def suggest_numbers(strategy='smart', n=9, historical_stats=None, df=None, randomness_factor=0.3, 
-                   use_high_prob=True, target_weekday=None, max_attempts=500):
+                   use_high_prob=True, target_weekday=None, max_attempts=500, weighted_freq=None):
     """
     產生建議號碼 (支援高機率特徵過濾)
     Args:
@@ -229,134 +388,130 @@ def suggest_numbers(strategy='smart', n=9, historical_stats=None, df=None, rando
         use_high_prob: 是否使用高機率特徵過濾
         target_weekday: 目標星期（0-6，0=週一）
         max_attempts: 最大嘗試次數
+        weighted_freq: 已算好的加權頻率陣列（None 時由 df 計算）
     """
-    numbers = list(range(1, 40))
-    
-    # 熱門號碼
-    hot_numbers = [1, 27, 11, 17, 23]
-    
-    # 特殊尾數
-    special_tails = [1, 4, 7]
-    
-    # 星期強勢號碼
-    weekday_strong_numbers = {
-        0: [6, 24, 17, 16, 1],
-        1: [38, 25, 23, 11, 19],
-        2: [38, 6, 1, 34, 23],
-        3: [27, 37, 35, 14, 17],
-        4: [8, 39, 17, 31, 9],
-        5: [8, 35, 24, 4, 20],
-    }
-
     if strategy == 'smart':
-        # 智能選號：時間加權 + 高機率特徵過濾
+        # 智能選號：時間加權 + 高機率特徵過濾，無法計算時退回隨機選號
         if df is not None:
-            try:
-                weighted_freq = compute_weighted_frequency(df)
-                if weighted_freq:
-                    # 決定是否要求連號（40%機率）
-                    require_consecutive = random.random() < 0.4
-                    
-                    best_numbers = None
-                    best_score = -1
-                    
-                    # 嘗試多次直到找到符合所有過濾的組合
-                    for attempt in range(max_attempts):
-                        # 根據加權頻率選號
-                        weights = [weighted_freq.get(num, 0.001) for num in numbers]
-                        
-                        # 加入隨機性
-                        adjusted_weights = []
-                        for w in weights:
-                            adjusted_weights.append(w * (1 - randomness_factor) + random.random() * randomness_factor)
-                        
-                        # 如果啟用高機率特徵，對特定號碼加權
-                        if use_high_prob:
-                            # 對熱門號加權
-                            for i, num in enumerate(numbers):
-                                if num in hot_numbers:
-                                    adjusted_weights[i] *= 1.3
-                            
-                            # 對星期強勢號加權
-                            if target_weekday is not None:
-                                strong_nums = weekday_strong_numbers.get(target_weekday, [])
-                                for i, num in enumerate(numbers):
-                                    if num in strong_nums:
-                                        adjusted_weights[i] *= 1.2
-                            
-                            # 對特殊尾數加權
-                            for i, num in enumerate(numbers):
-                                if (num % 10) in special_tails:
-                                    adjusted_weights[i] *= 1.1
-                        
-                        # 正規化權重
-                        adjusted_weights = np.array(adjusted_weights)
-                        adjusted_weights = adjusted_weights / adjusted_weights.sum()
-                        
-                        # 根據權重選號
-                        selected = np.random.choice(numbers, size=n, replace=False, p=adjusted_weights)
-                        result = sorted([int(x) for x in selected.tolist()])
-                        
-                        # 檢查是否通過高機率特徵過濾
-                        if use_high_prob:
-                            passed, score = apply_high_prob_filters(result, target_weekday, require_consecutive)
-                            
-                            if passed and score > best_score:
-                                best_numbers = result
-                                best_score = score
-                                
-                                # 如果分數夠高，提前返回
-                                if score >= 70:
-                                    break
-                        else:
-                            # 不使用過濾，直接返回
-                            logger.info(f"🧠 時間加權選號 (和值:{sum(result[:5])}): {result}")
-                            return result
-                    
-                    # 如果找到符合規則的組合，返回最佳的
-                    if best_numbers is not None:
-                        logger.info(f"🧠 高機率特徵選號 (分數:{best_score}, 和值:{sum(best_numbers[:5])}): {best_numbers}")
-                        return best_numbers
-                    
-                    # 如果超過最大嘗試次數，返回最後一次結果
-                    logger.warning(f"⚠️ 超過 {max_attempts} 次嘗試，使用備用選號")
-                    return result
-            except Exception as e:
-                logger.warning(f"⚠️ 智能選號失敗: {e}")
-        
-        return sorted(random.sample(numbers, n))
-    elif strategy == 'balanced':
-        # 平衡策略：純隨機選號
-        result = sorted(random.sample(numbers, n))
-        logger.info(f"⚖️ 平衡策略: {result}")
+            result = _suggest_smart_numbers(df, n, randomness_factor, use_high_prob, target_weekday, max_attempts,
+                                            weighted_freq)
+            if result is not None:
+                return result
+        return _suggest_random_numbers(n)
+    
+    # 其他策略不需要歷史資料，直接查表呼叫（未知策略使用隨機選號）
+    return _SIMPLE_STRATEGIES.get(strategy, _suggest_random_numbers)(n)
+
+
+def _suggest_random_numbers(n):
+    """純隨機選號（與智能選號共用同一個亂數產生器）"""
+    return sorted(_RNG.choice(np.arange(1, 40), size=n, replace=False).tolist())
+
+
+def _suggest_balanced_numbers(n):
+    """平衡策略：純隨機選號"""
+    result = _suggest_random_numbers(n)
+    logger.info(f"⚖️ 平衡策略: {result}")
+    return result
+
+
+_SIMPLE_STRATEGIES = {
+    'balanced': _suggest_balanced_numbers,
+}
+
+
+def _suggest_smart_numbers(df, n, randomness_factor, use_high_prob, target_weekday, max_attempts,
+                           weighted_freq=None):
+    """智能選號的實際計算（加權頻率無法計算或發生錯誤時回傳 None）"""
+    numbers = list(range(1, 40))
+    try:
+        if weighted_freq is None:
+            weighted_freq = compute_weighted_frequency_array(df)
+        if weighted_freq is None:
+            return None
+        
+        # 決定是否要求連號（40%機率）
+        require_consecutive = _RNG.random() < 0.4
+        
+        best_numbers = None
+        best_score = -1
+        
+        # 根據加權頻率選號
+        weights = weighted_freq[numbers].astype(np.float32)
+        
+        # 如果啟用高機率特徵，對特定號碼加權（每次嘗試都相同，只計算一次）
+        boost = np.ones(len(numbers), dtype=np.float32)
+        if use_high_prob:
+            # 對熱門號、星期強勢號、特殊尾數加權（直接取用預先算好的倍率）
+            if target_weekday is not None:
+                boost = WEEKDAY_BOOST[target_weekday, numbers]
+            else:
+                boost = BASE_BOOST[numbers]
+        
+        # 一次產生所有嘗試的候選組合：每列加入隨機性後正規化（float32 即足夠，減半記憶體頻寬）
+        attempts = max_attempts if use_high_prob else 1
+        # (w*(1-r) + noise*r) * boost 展開成兩個常數向量，在同一個緩衝區內原地運算
+        base = weights * (1 - randomness_factor) * boost
+        noise_scale = randomness_factor * boost
+        adjusted_weights = _RNG.random((attempts, len(numbers)), dtype=np.float32)
+        adjusted_weights *= noise_scale
+        adjusted_weights += base
+        adjusted_weights /= adjusted_weights.sum(axis=1, keepdims=True)
+        
+        # 根據權重不重複抽號（Gumbel-top-k，與逐一依權重抽取的分佈相同）
+        keys = np.log(adjusted_weights, out=adjusted_weights)
+        keys += _RNG.gumbel(size=keys.shape)
+        picks = np.argpartition(keys, -n, axis=1)[:, -n:]
+        candidates = np.sort(np.asarray(numbers)[picks], axis=1)
+        result = candidates[-1].tolist()
+        
+        if not use_high_prob:
+            # 不使用過濾，直接返回
+            logger.info(f"🧠 時間加權選號 (和值:{sum(result[:5])}): {result}")
+            return result
+        
+        # 一次評估所有候選組合是否通過高機率特徵過濾
+        passed, scores = _batch_high_prob_filters(candidates, target_weekday, require_consecutive)
+        if passed.any():
+            # 依原本逐一嘗試的順序：第一組達 70 分者提前採用，否則取最高分中最早出現者
+            high = np.flatnonzero(passed & (scores >= 70))
+            if len(high) > 0:
+                best_index = high[0]
+            else:
+                best_index = np.flatnonzero(passed)[np.argmax(scores[passed])]
+            best_numbers = candidates[best_index].tolist()
+            best_score = int(scores[best_index])
+        
+        # 如果找到符合規則的組合，返回最佳的
+        if best_numbers is not None:
+            logger.info(f"🧠 高機率特徵選號 (分數:{best_score}, 和值:{sum(best_numbers[:5])}): {best_numbers}")
+            return best_numbers
+        
+        # 如果超過最大嘗試次數，返回最後一次結果
+        logger.warning(f"⚠️ 超過 {max_attempts} 次嘗試，使用備用選號")
         return result
-    else:
-        # 其他策略暫不使用
-        return sorted(random.sample(numbers, n))
+    except Exception as e:
+        logger.warning(f"⚠️ 智能選號失敗: {e}")
+        return None
 
 
-def select_top_weighted_numbers(nine_numbers, df, n=7):
+def select_top_weighted_numbers(nine_numbers, df, n=7, weighted_freq=None):
     """
     從九顆號碼中選取加權最高的七顆
-    使用智能選號的加權邏輯來排序九顆號碼
+    使用智能選號的加權邏輯來排序九顆號碼（可傳入已算好的 weighted_freq 避免重算）
     """
     try:
         if df is not None:
             # 使用與智能選號相同的加權計算
-            weighted_freq = compute_weighted_frequency(df)
-            if weighted_freq:
+            if weighted_freq is None:
+                weighted_freq = compute_weighted_frequency_array(df)
+            if weighted_freq is not None:
                 # 計算九顆號碼的加權分數
-                number_scores = []
-                for num in nine_numbers:
-                    score = weighted_freq.get(num, 0.001)
-                    number_scores.append((num, score))
+                scores = weighted_freq[np.asarray(nine_numbers, dtype=np.int64)]
                 
-                # 按加權分數排序（高分在前）
-                number_scores.sort(key=lambda x: x[1], reverse=True)
-                
-                # 選取前七顆
-                top_seven = [num for num, _ in number_scores[:n]]
-                result = sorted(top_seven)
+                # 按加權分數排序（高分在前，同分維持原順序），選取前七顆
+                order = np.argsort(-scores, kind='stable')[:n]
+                result = sorted(int(nine_numbers[i]) for i in order)
                 logger.info(f"🎯 從九顆中選取加權最高的七顆: {result}")
                 return result
     except Exception as e:
@@ -366,27 +521,28 @@ def select_top_weighted_numbers(nine_numbers, df, n=7):
     return sorted(nine_numbers[:n])
 
 
-def _build_ev_scores(df, target_date):
+def _ev_train_df(df, target_date):
+    """EV 策略的訓練區間：target_date 前 EV_LOOKBACK_DAYS 天；區間內沒有資料時改用 target_date 前的全部紀錄"""
     train_df = df[(df['日期'] < target_date) & (df['日期'] >= target_date - pd.Timedelta(days=EV_LOOKBACK_DAYS))]
     if len(train_df) == 0:
         train_df = df[df['日期'] < target_date].copy()
+    return train_df
+
+
+def _build_ev_scores(df, target_date, train_df=None):
+    if train_df is None:
+        train_df = _ev_train_df(df, target_date)
     if len(train_df) == 0:
         return np.zeros(40, dtype=float)
-    scores = np.zeros(40, dtype=float)
-    days_ago = (target_date - train_df['日期']).dt.days.clip(lower=0).to_numpy()
-    row_weights = np.power(EV_DECAY, days_ago)
+    days_ago = np.maximum(_days_before(target_date, train_df['日期']), 0)
+    row_weights = _decay_weights(days_ago, EV_DECAY)
     draw_matrix = train_df[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int)
-    for i in range(draw_matrix.shape[0]):
-        w = row_weights[i]
-        for num in draw_matrix[i]:
-            scores[num] += w
+    # 號碼只有 1-39，直接以 bincount 累加（每期權重對應到該期五個號碼）
+    scores = np.bincount(draw_matrix.ravel(), weights=np.repeat(row_weights, draw_matrix.shape[1]), minlength=40)
     if EV_W_MOMENTUM > 0:
         recent = train_df.tail(EV_MOMENTUM_K)[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int)
         if len(recent) > 0:
-            momentum = np.zeros(40, dtype=float)
-            for row in recent:
-                for num in row:
-                    momentum[num] += 1.0
+            momentum = np.bincount(recent.ravel(), minlength=40).astype(float)
             scores += EV_W_MOMENTUM * (momentum / len(recent))
     if EV_W_OVERDUE > 0:
         last_seen = np.full(40, -1, dtype=int)
@@ -403,12 +559,8 @@ def _build_ev_scores(df, target_date):
         wd = int(target_date.weekday())
         wd_df = train_df[train_df['日期'].dt.weekday == wd]
         if len(wd_df) > 0:
-            wd_scores = np.zeros(40, dtype=float)
             wd_draws = wd_df[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int)
-            for row in wd_draws:
-                for num in row:
-                    wd_scores[num] += 1.0
-            wd_scores = wd_scores / len(wd_df)
+            wd_scores = np.bincount(wd_draws.ravel(), minlength=40) / len(wd_df)
             scores += EV_W_WEEKDAY * wd_scores
     scores[0] = -1e9
     return scores
@@ -427,16 +579,10 @@ def _pair_boost(train_df):
     if len(train_df) < 10:
         return scores
     draws = train_df[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int)
-    pair_counts = np.zeros((40, 40), dtype=float)
-    for row in draws:
-        r = sorted(int(x) for x in row)
-        for i in range(len(r)):
-            for j in range(i + 1, len(r)):
-                a, b = r[i], r[j]
-                pair_counts[a, b] += 1.0
-                pair_counts[b, a] += 1.0
-    for n in range(1, 40):
-        scores[n] = pair_counts[n].sum()
+    # 號碼 n 的配對總數 = 40x40 配對矩陣第 n 列的和；每出現一次恰與同期其餘號碼各配對一次，
+    # 故等於 出現次數 x (每期號碼數 - 1)，不必建出整個配對矩陣
+    counts = np.bincount(draws.ravel(), minlength=40).astype(float)
+    scores[1:] = counts[1:] * (draws.shape[1] - 1)
     return _normalize_scores(scores)
 
 
@@ -445,13 +591,9 @@ def _repeat_boost(train_df):
     if len(train_df) < 2:
         return scores
     draws = train_df[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int)
-    overlap_count = np.zeros(40, dtype=float)
-    for i in range(1, len(draws)):
-        prev_set = set(int(x) for x in draws[i - 1])
-        curr = [int(x) for x in draws[i]]
-        for num in curr:
-            if num in prev_set:
-                overlap_count[num] += 1.0
+    # 每期五個號碼與前一期五個號碼一次比對 (N-1, 5, 5)，取代逐期建立 set 再逐一查詢
+    repeated = (draws[1:, :, None] == draws[:-1, None, :]).any(axis=2)
+    overlap_count = np.bincount(draws[1:][repeated], minlength=40).astype(float)
     return _normalize_scores(overlap_count)
 
 
@@ -464,14 +606,9 @@ def _regime_boost(train_df, short_days=30, long_days=180):
     long_df = train_df[train_df['日期'] >= end_date - pd.Timedelta(days=long_days)]
     if len(short_df) == 0 or len(long_df) == 0:
         return scores
-    short_freq = np.zeros(40, dtype=float)
-    long_freq = np.zeros(40, dtype=float)
-    for row in short_df[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int):
-        for n in row:
-            short_freq[int(n)] += 1.0
-    for row in long_df[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int):
-        for n in row:
-            long_freq[int(n)] += 1.0
+    # 號碼只有 1-39，直接以 bincount 計次
+    short_freq = np.bincount(short_df[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int).ravel(), minlength=40).astype(float)
+    long_freq = np.bincount(long_df[['號碼1', '號碼2', '號碼3', '號碼4', '號碼5']].to_numpy(dtype=int).ravel(), minlength=40).astype(float)
     short_freq = short_freq / max(1.0, len(short_df))
     long_freq = long_freq / max(1.0, len(long_df))
     delta = short_freq - long_freq
@@ -481,11 +618,9 @@ def _regime_boost(train_df, short_days=30, long_days=180):
 
 
 def _build_ev_scores_enhanced(df, target_date):
-    base = _build_ev_scores(df, target_date)
-    train_df = df[(df['日期'] < target_date) & (df['日期'] >= target_date - pd.Timedelta(days=EV_LOOKBACK_DAYS))]
-    if len(train_df) == 0:
-        train_df = df[df['日期'] < target_date].copy()
-    scores = base.copy()
+    # 訓練區間只篩選一次，基礎分數與各項加成共用
+    train_df = _ev_train_df(df, target_date)
+    scores = _build_ev_scores(df, target_date, train_df)
     scores += EV_W_PAIR * _pair_boost(train_df)
     scores += EV_W_REPEAT * _repeat_boost(train_df)
     scores += EV_W_REGIME * _regime_boost(train_df)
@@ -493,9 +628,11 @@ def _build_ev_scores_enhanced(df, target_date):
     return scores
 
 
-def suggest_ev_numbers(df, n, target_date):
-    scores = _build_ev_scores_enhanced(df, target_date)
-    selected = np.argsort(scores)[::-1][:n]
+def suggest_ev_numbers(df, n, target_date, scores=None):
+    if scores is None:
+        scores = _build_ev_scores_enhanced(df, target_date)
+    # 只需要前 n 名且最後會重新排序，argpartition 不必整列排序
+    selected = np.argpartition(-scores, n - 1)[:n]
     return sorted(int(x) for x in selected.tolist())
 
 
@@ -521,59 +658,63 @@ def log_predictions_to_excel(predictions, log_file="prediction_log.xlsx"):
     # 檢查檔案是否存在
     log_path = Path(log_file)
     
+    # 直接以 openpyxl 操作工作表：只改動目標那一列，不重建整份 DataFrame
+    workbook = None
     if log_path.exists():
         try:
-            existing_df = pd.read_excel(log_file, engine='openpyxl')
+            workbook = load_workbook(log_file)
+            sheet = workbook.worksheets[0]
+            headers = [cell.value for cell in sheet[1]]
             
-            # 檢查是否有相同日期和時間的記錄（避免重複執行產生的記錄）
-            same_datetime_records = existing_df[
-                (existing_df['日期'] == date_str) & 
-                (existing_df['時間'] == time_str)
-            ]
+            # 檢查是否有新欄位需要添加到現有數據
+            for key in log_data:
+                if key not in headers:
+                    headers.append(key)
+                    sheet.cell(row=1, column=len(headers), value=key)
+            col_index = {name: i + 1 for i, name in enumerate(headers)}
             
-            if len(same_datetime_records) > 0:
-                # 有相同日期時間的記錄，更新最新的一筆（避免重複執行覆蓋）
-                latest_same_datetime_index = same_datetime_records.index[-1]
-                
+            # 檢查是否有相同日期和時間的記錄（避免重複執行產生的記錄），取最新的一筆
+            target_row = None
+            date_col, time_col = col_index['日期'], col_index['時間']
+            for row_idx in range(sheet.max_row, 1, -1):
+                if (sheet.cell(row=row_idx, column=date_col).value == date_str and
+                        sheet.cell(row=row_idx, column=time_col).value == time_str):
+                    target_row = row_idx
+                    break
+            
+            if target_row is not None:
+                # 有相同日期時間的記錄，更新該筆（避免重複執行覆蓋）
                 # 保留已驗證的結果（如果有的話）
-                old_record = existing_df.loc[latest_same_datetime_index]
-                if pd.notna(old_record.get('驗證結果', '')) and old_record.get('驗證結果', '') != '':
-                    log_data['驗證結果'] = old_record['驗證結果']
-                    log_data['中獎號碼數'] = old_record['中獎號碼數']
+                old_result = sheet.cell(row=target_row, column=col_index['驗證結果']).value
+                if old_result is not None and old_result != '':
+                    log_data['驗證結果'] = old_result
+                    log_data['中獎號碼數'] = sheet.cell(row=target_row, column=col_index['中獎號碼數']).value
                     log_data['備註'] = f"539智能+EV對照策略（保留驗證結果） - {os.environ.get('GITHUB_WORKFLOW', 'Unknown')}"
                     logger.info("🔄 更新相同日期時間記錄，保留已驗證結果")
                 else:
                     logger.info("🔄 更新相同日期時間記錄")
-                
-                # 更新該記錄
-                for key, value in log_data.items():
-                    if key in existing_df.columns:
-                        existing_df.loc[latest_same_datetime_index, key] = value
-                    else:
-                        existing_df[key] = ''
-                        existing_df.loc[latest_same_datetime_index, key] = value
-                
-                combined_df = existing_df
             else:
                 # 沒有相同日期時間的記錄，新增一筆
-                new_df = pd.DataFrame([log_data])
-                
-                # 檢查是否有新欄位需要添加到現有數據
-                for col in new_df.columns:
-                    if col not in existing_df.columns:
-                        existing_df[col] = ''
-                
-                combined_df = pd.concat([existing_df, new_df], ignore_index=True)
+                target_row = sheet.max_row + 1
+            
+            # 更新該記錄
+            for key, value in log_data.items():
+                sheet.cell(row=target_row, column=col_index[key], value=value)
                 
         except Exception as e:
             logger.error(f"讀取現有記錄檔案時發生錯誤: {e}")
-            combined_df = pd.DataFrame([log_data])
-    else:
-        combined_df = pd.DataFrame([log_data])
+            workbook = None
+    
+    if workbook is None:
+        # 新檔案使用 write-only 模式直接寫入標題與記錄
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(title='Sheet1')
+        sheet.append(list(log_data.keys()))
+        sheet.append(list(log_data.values()))
     
     # 寫入Excel
     try:
-        combined_df.to_excel(log_file, index=False, engine='openpyxl')
+        workbook.save(log_file)
         logger.info(f"✅ 預測記錄已保存到: {log_file}")
         logger.info(f"   記錄時間: {date_str} {time_str}")
         return True
@@ -604,13 +745,15 @@ def is_prediction_day(check_date=None):
     # 週一到週六預測 (0-5)，週日不預測 (6)
     is_predict_day = weekday < 6
     
-    weekday_names = ['週一', '週二', '週三', '週四', '週五', '週六', '週日']
-    logger.info(f"📅 檢查日期: {check_date.strftime('%Y-%m-%d')} ({weekday_names[weekday]})")
-    
-    if is_predict_day:
-        logger.info(f"✅ {weekday_names[weekday]} 執行預測")
-    else:
-        logger.info(f"⏸️ {weekday_names[weekday]} 跳過預測，留給週一自己預測")
+    # 日誌未開啟 INFO 時略過日期格式化
+    if logger.isEnabledFor(logging.INFO):
+        weekday_names = ['週一', '週二', '週三', '週四', '週五', '週六', '週日']
+        logger.info(f"📅 檢查日期: {check_date.strftime('%Y-%m-%d')} ({weekday_names[weekday]})")
+        
+        if is_predict_day:
+            logger.info(f"✅ {weekday_names[weekday]} 執行預測")
+        else:
+            logger.info(f"⏸️ {weekday_names[weekday]} 跳過預測，留給週一自己預測")
     
     return is_predict_day
 
@@ -654,15 +797,21 @@ def main():
         logger.info(f"   6. 特殊尾數: 1, 4, 7")
         logger.info("="*60)
         
+        # 加權頻率只算一次，供智能九顆與七顆共用
+        weighted_freq = compute_weighted_frequency_array(df)
+        
         # 生成智能九顆策略（帶高機率特徵過濾）
         smart_9 = suggest_numbers('smart', n=9, df=df, randomness_factor=randomness_factor,
-                                 use_high_prob=use_high_prob, target_weekday=today_weekday)
-        # 生成EV九顆策略（近一年回測最佳參數）
-        ev_9 = suggest_ev_numbers(df, n=9, target_date=datetime.now())
+                                 use_high_prob=use_high_prob, target_weekday=today_weekday,
+                                 weighted_freq=weighted_freq)
+        # 生成EV九顆策略（近一年回測最佳參數），EV 分數只算一次供九顆與七顆共用
+        target_date = datetime.now()
+        ev_scores = _build_ev_scores_enhanced(df, target_date)
+        ev_9 = suggest_ev_numbers(df, n=9, target_date=target_date, scores=ev_scores)
         
         # 生成七顆策略（智能由智能九顆衍生，EV獨立選號）
-        smart_7 = select_top_weighted_numbers(smart_9, df, n=7)
-        ev_7 = suggest_ev_numbers(df, n=7, target_date=datetime.now())
+        smart_7 = select_top_weighted_numbers(smart_9, df, n=7, weighted_freq=weighted_freq)
+        ev_7 = suggest_ev_numbers(df, n=7, target_date=target_date, scores=ev_scores)
         
         # 儲存結果
         predictions['smart_9'] = smart_9
@@ -503,21 +503,17 @@ class Fantasy5Crawler:
                 logger.error(f"🛑 歷史檔案不存在: {history_filename}。中止，避免建立殘缺檔覆蓋雲端。若確為首次建置，請手動放置種子檔後再執行。")
                 return False
             
-            # 建立新結果的DataFrame
-            new_df = pd.DataFrame(formatted_results)
-            
             # 檢查重複記錄
             new_records = []
             existing_dates = set()
             
             if not existing_df.empty:
-                # 取得現有記錄的日期
-                for _, row in existing_df.iterrows():
-                    date_str = str(row['日期'])[:10]  # 只取日期部分
-                    existing_dates.add(date_str)
+                # 取得現有記錄的日期（整欄一次轉字串並只取日期部分）
+                existing_dates = set(existing_df['日期'].astype(str).str[:10])
             
             # 過濾新記錄
-            for _, row in new_df.iterrows():
+            # 新結果本來就是 dict 串列，直接逐筆過濾，不先建成 DataFrame 再 iterrows
+            for row in formatted_results:
                 date_str = str(row['日期'])[:10]  # 只取日期部分
                 if date_str not in existing_dates:
                     new_records.append(row)
@@ -529,7 +525,7 @@ class Fantasy5Crawler:
                 logger.info("ℹ️ 沒有新的記錄需要添加")
                 return True
             
-            # 合併記錄
+            # 合併記錄（由 dict 串列一次建立新資料列）
             new_records_df = pd.DataFrame(new_records)
             updated_df = pd.concat([existing_df, new_records_df], ignore_index=True)
             
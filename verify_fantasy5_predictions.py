@@ -6,7 +6,40 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 from datetime import datetime, timedelta
-import ast
+import re
+from openpyxl import load_workbook
+
+try:
+    import python_calamine  # noqa: F401
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
+def _read_excel(path):
+    """讀取Excel：優先使用 calamine 引擎，失敗時退回 openpyxl"""
+    if CALAMINE_AVAILABLE:
+        try:
+            return pd.read_excel(path, engine='calamine')
+        except Exception:
+            pass
+    return pd.read_excel(path, engine='openpyxl')
+
+def _write_verification_cells(log_file, predictions_df, row_indices, columns=('驗證結果', '中獎號碼數')):
+    """只把有更新的驗證欄位寫回工作表，其餘列與儲存格保持原樣（不重寫整份記錄）"""
+    workbook = load_workbook(log_file)
+    sheet = workbook.worksheets[0]
+    headers = [cell.value for cell in sheet[1]]
+    for col in columns:
+        if col not in headers:
+            headers.append(col)
+            sheet.cell(row=1, column=len(headers), value=col)
+    col_index = {name: i + 1 for i, name in enumerate(headers)}
+    
+    for idx in row_indices:
+        # DataFrame 第 idx 列對應工作表第 idx + 2 列（第 1 列為標題）
+        for col in columns:
+            sheet.cell(row=idx + 2, column=col_index[col], value=predictions_df.at[idx, col])
+    workbook.save(log_file)
 
 def is_lottery_draw_day(check_date=None):
     """
@@ -41,7 +74,7 @@ def is_lottery_draw_day(check_date=None):
 def load_latest_fantasy5_results(excel_path: str):
     """讀取最新的加州Fantasy 5開獎結果"""
     try:
-        df = pd.read_excel(excel_path, engine='openpyxl')
+        df = _read_excel(excel_path)
         if len(df) == 0:
             print("加州Fantasy 5開獎資料檔案為空")
             return None
@@ -62,21 +95,19 @@ def load_latest_fantasy5_results(excel_path: str):
         print(f"讀取加州Fantasy 5開獎資料時發生錯誤: {e}")
         return None
 
+# 預測號碼字串中以逗號、空白或方括號分隔的各個欄位
+_TOKEN_PATTERN = re.compile(r'[^\s,\[\]]+')
+
 def parse_prediction_numbers(prediction_str):
     """解析預測號碼字串為數字列表"""
     try:
-        # 移除多餘的空白和換行
-        prediction_str = prediction_str.strip()
-        
-        # 嘗試使用 ast.literal_eval 解析
-        if prediction_str.startswith('[') and prediction_str.endswith(']'):
-            return ast.literal_eval(prediction_str)
-        
-        # 如果不是標準格式，嘗試其他方式解析
-        # 移除方括號和空白，分割數字
-        numbers_str = prediction_str.replace('[', '').replace(']', '').replace(' ', '')
-        numbers = [int(x) for x in numbers_str.split(',') if x.strip().isdigit()]
-        return numbers
+        # "[1, 2, 3]" 與 "1,2,3" 都適用，不必經過 ast.literal_eval 建立語法樹
+        tokens = _TOKEN_PATTERN.findall(prediction_str)
+        # 每個欄位都必須是 1-39 的整數；"1.0" 之類的格式整筆視為無效，避免算出錯誤的中獎數
+        if all(token.isdigit() and 1 <= int(token) <= 39 for token in tokens):
+            return [int(token) for token in tokens]
+        print(f"解析預測號碼時發生錯誤: {prediction_str} -> 含有非 1-39 整數的欄位")
+        return []
         
     except Exception as e:
         print(f"解析預測號碼時發生錯誤: {prediction_str} -> {e}")
@@ -115,7 +146,7 @@ def verify_fantasy5_predictions(prediction_log_file="fantasy5_prediction_log.xls
     
     # 讀取預測記錄
     try:
-        predictions_df = pd.read_excel(prediction_log_file, engine='openpyxl')
+        predictions_df = _read_excel(prediction_log_file)
         print(f"找到 {len(predictions_df)} 筆加州Fantasy 5預測記錄")
     except Exception as e:
         print(f"讀取預測記錄時發生錯誤: {e}")
@@ -123,7 +154,7 @@ def verify_fantasy5_predictions(prediction_log_file="fantasy5_prediction_log.xls
     
     # 讀取開獎結果資料
     try:
-        lottery_df = pd.read_excel(lottery_results_file, engine='openpyxl')
+        lottery_df = _read_excel(lottery_results_file)
         if len(lottery_df) == 0:
             print("加州Fantasy 5開獎結果檔案為空")
             return
@@ -136,12 +167,20 @@ def verify_fantasy5_predictions(prediction_log_file="fantasy5_prediction_log.xls
     current_date = datetime.now()
     verification_count = 0
     updates_made = False
+    updated_rows = []
     
-    for index, row in predictions_df.iterrows():
-        # 檢查是否已經驗證過
-        if '驗證結果' in row and pd.notna(row.get('驗證結果', '')) and row.get('驗證結果', '') != '':
-            continue
-        
+    # 已驗證過的記錄整欄一次排除，只逐筆處理尚未驗證的列
+    if '驗證結果' in predictions_df.columns:
+        verified_mask = predictions_df['驗證結果'].notna() & (predictions_df['驗證結果'] != '')
+        pending_df = predictions_df[~verified_mask]
+    else:
+        pending_df = predictions_df
+    
+    # 開獎日期整欄只解析一次（無法解析者為 NaT，比對時自然不成立），不在每筆預測內重複轉換
+    lottery_dates = pd.to_datetime(lottery_df['日期'], format='mixed', errors='coerce')
+    lottery_days = lottery_dates.dt.normalize()
+    
+    for index, row in pending_df.iterrows():
         # 檢查預測日期是否在驗證範圍內
         try:
             prediction_date = pd.to_datetime(row['日期'])
@@ -156,18 +195,12 @@ def verify_fantasy5_predictions(prediction_log_file="fantasy5_prediction_log.xls
             continue
         
         # 尋找對應日期的開獎結果
+        # 檢查日期是否匹配或預測日期之後有開獎，取檔案中第一筆符合者
         matching_lottery = None
-        for _, lottery_row in lottery_df.iterrows():
-            try:
-                lottery_date = pd.to_datetime(lottery_row['日期'])
-                lottery_date_str = lottery_date.strftime('%Y-%m-%d')
-                
-                # 檢查日期是否匹配或預測日期之後有開獎
-                if lottery_date_str == prediction_date_str or lottery_date > prediction_date:
-                    matching_lottery = lottery_row
-                    break
-            except:
-                continue
+        is_match = (lottery_days == prediction_date.normalize()) | (lottery_dates > prediction_date)
+        match_positions = np.flatnonzero(is_match.to_numpy())
+        if len(match_positions) > 0:
+            matching_lottery = lottery_df.iloc[match_positions[0]].to_dict()
         
         if matching_lottery is None:
             print(f"{prediction_date_str} 的加州Fantasy 5預測尚無對應開獎結果，跳過驗證")
@@ -228,11 +261,12 @@ def verify_fantasy5_predictions(prediction_log_file="fantasy5_prediction_log.xls
             predictions_df.at[index, '中獎號碼數'] = max_matches
             verification_count += 1
             updates_made = True
+            updated_rows.append(index)
     
     # 儲存更新後的記錄
     if updates_made:
         try:
-            predictions_df.to_excel(prediction_log_file, index=False, engine='openpyxl')
+            _write_verification_cells(prediction_log_file, predictions_df, updated_rows)
             print(f"\n已更新 {verification_count} 筆加州Fantasy 5預測記錄的驗證結果")
         except Exception as e:
             print(f"儲存驗證結果時發生錯誤: {e}")
@@ -293,8 +327,8 @@ def auto_verify_on_startup(prediction_log_file="fantasy5_prediction_log.xlsx",
     
     # 檢查是否有可驗證的記錄
     try:
-        predictions_df = pd.read_excel(prediction_log_file, engine='openpyxl')
-        lottery_df = pd.read_excel(lottery_results_file, engine='openpyxl')
+        predictions_df = _read_excel(prediction_log_file)
+        lottery_df = _read_excel(lottery_results_file)
         
         if len(predictions_df) == 0:
             print("加州Fantasy 5預測記錄檔案為空")